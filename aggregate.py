@@ -0,0 +1,154 @@
+# Grouped statistics over the columnar match store (see match_store.py). Every metric is attached to a player row
+# (one per player per match), so any grouping of player rows (by character, player, player-character combination or
+# match outcome) can be reduced with a couple of np.bincount calls instead of filling and summarizing Python lists.
+#
+# Per-player metrics (stocks taken/lost, damage dealt/taken) have one value per player row. Kill and death percents
+# have one value per stock lost: a death percent belongs to the player who died, and the same value is a kill
+# percent for their opponent.
+#
+#     python aggregate.py character [--min-matches 30] [--json]
+
+import argparse
+import json
+
+import numpy as np
+
+from instrumentation import span
+
+PLAYER_METRICS = ['kills', 'deaths', 'damage_dealt', 'damage_taken']
+STOCK_METRICS = ['kill_pcts', 'death_pcts']
+METRICS = STOCK_METRICS + PLAYER_METRICS
+GROUPINGS = ['character', 'player', 'hybrid', 'outcome']
+
+
+# Returns one integer key per player row for the given grouping, along with the number of possible keys. The hybrid
+# (player-character) key is player * num_characters + character; see hybrid_code.
+def group_keys(store, grouping):
+    players = store['players']
+    if grouping == 'character':
+        return np.asarray(players['character']), len(store.character_names)
+    elif grouping == 'player':
+        return np.asarray(players['player']), len(store.player_names)
+    elif grouping == 'hybrid':
+        num_characters = len(store.character_names)
+        return players['player'].astype(np.int64) * num_characters + players['character'], \
+            len(store.player_names) * num_characters
+    elif grouping == 'outcome':
+        return players['won'].astype(np.int64), 2
+    raise ValueError('Unknown grouping: ' + grouping)
+
+
+def hybrid_code(store, player, char):
+    return store.player_code(player) * len(store.character_names) + store.character_code(char)
+
+
+# Returns (player_rows, values) for a metric: the values, and the player row each one belongs to
+def metric_values(store, metric):
+    if metric in PLAYER_METRICS:
+        values = np.asarray(store['players'][metric])
+        return np.arange(len(values)), values
+    stocks = store['stocks']
+    death_percent = np.asarray(stocks['death_percent'])
+    died = ~np.isnan(death_percent)
+    match = stocks['match'][died].astype(np.int64)
+    slot = stocks['slot'][died]
+    if metric == 'death_pcts':
+        return 2 * match + slot, death_percent[died]
+    elif metric == 'kill_pcts':
+        return 2 * match + 1 - slot, death_percent[died]
+    raise ValueError('Unknown metric: ' + metric)
+
+
+# Count, mean, standard deviation and 95% confidence half-width of values grouped by keys, as arrays indexed by key.
+# The standard deviation is the population one (np.std's default) and the confidence interval is the same
+# 1.96 * std / sqrt(n) normal approximation the plots have always used. Empty groups come out as NaN.
+def group_stats(keys, values, num_groups):
+    values = np.asarray(values, dtype=np.float64)
+    count = np.bincount(keys, minlength=num_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(keys, weights=values, minlength=num_groups) / count
+        # Deviations are taken from each group's mean rather than using sums of squares, which loses precision
+        deviations = values - mean[keys]
+        std = np.sqrt(np.bincount(keys, weights=deviations * deviations, minlength=num_groups) / count)
+        ci = 1.96 * std / np.sqrt(count)
+    return {'count': count, 'mean': mean, 'std': std, 'ci': ci}
+
+
+# Computes group_stats for every metric over one grouping, as {metric: stats}
+def aggregate(store, grouping, metrics=METRICS):
+    with span('aggregate.' + grouping):
+        keys, num_groups = group_keys(store, grouping)
+        results = {}
+        for metric in metrics:
+            rows, values = metric_values(store, metric)
+            results[metric] = group_stats(keys[rows], values, num_groups)
+    return results
+
+
+# The raw values of a metric split by group, for plots that need the whole distribution (histograms, boxplots).
+# Within a group, values keep the order of the matches they came from.
+def group_values(store, grouping, metric):
+    keys, num_groups = group_keys(store, grouping)
+    rows, values = metric_values(store, metric)
+    keys = keys[rows]
+    order = np.argsort(keys, kind='stable')
+    bounds = np.searchsorted(keys[order], np.arange(num_groups + 1))
+    values = values[order]
+    return [values[bounds[i]:bounds[i + 1]] for i in range(num_groups)]
+
+
+# A label for every key of a grouping, in key order
+def group_names(store, grouping):
+    if grouping == 'character':
+        return store.character_names
+    elif grouping == 'player':
+        return store.player_names
+    elif grouping == 'outcome':
+        return ['loss', 'win']
+    return [player + "'s " + char for player in store.player_names for char in store.character_names]
+
+
+# {label: {'matches': n, metric: {'mean', 'std', 'ci', 'count'}}} for every group found in at least min_matches
+# matches, most played first. Means of groups with no values (e.g. no stocks lost) are None rather than NaN.
+def group_table(store, grouping, min_matches):
+    stats = aggregate(store, grouping)
+    names = group_names(store, grouping)
+    matches = stats[PLAYER_METRICS[0]]['count']
+    table = {}
+    for group in np.argsort(-matches, kind='stable'):
+        if matches[group] < min_matches:
+            continue
+        row = {'matches': int(matches[group])}
+        for metric in METRICS:
+            row[metric] = {key: None if np.isnan(stats[metric][key][group]) else float(stats[metric][key][group])
+                           for key in ('mean', 'std', 'ci')}
+            row[metric]['count'] = int(stats[metric]['count'][group])
+        table[names[group]] = row
+    return table
+
+
+def main():
+    from analysis import MIN_MATCHES
+    from ingest import load_synced_columns
+
+    parser = argparse.ArgumentParser(description='Mean, standard deviation and 95%% margin of every metric over the '
+                                                 'synced matches, by group.')
+    parser.add_argument('grouping', choices=GROUPINGS)
+    parser.add_argument('--min-matches', type=int, default=MIN_MATCHES,
+                        help='leave out groups found in fewer matches than this (default: %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    table = group_table(load_synced_columns(), args.grouping, args.min_matches)
+    if args.json:
+        print(json.dumps(table, indent=2))
+        return
+    print('%-32s %8s' % (args.grouping, 'matches') + ''.join('%20s' % metric for metric in METRICS))
+    for name, row in table.items():
+        print('%-32s %8d' % (name, row['matches']) +
+              ''.join('%20s' % ('-' if row[metric]['mean'] is None else
+                                '%.2f +- %.2f' % (row[metric]['mean'], row[metric]['ci'])) for metric in METRICS))
+
+
+if __name__ == '__main__':
+    main()
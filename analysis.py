@@ -0,0 +1,147 @@
+# Turns the columnar match store and the fused metric results into everything the charts and printouts need. The
+# result is a plain dict of small NumPy arrays, lists and numbers, so it can be handed to the plotting code as is or
+# pickled off to worker processes (see report.py).
+#
+# Confidence intervals use the normal approximation by default. Passing a number of bootstrap resamples switches them
+# to bootstrap intervals over resampled matches (see bootstrap.py), in which case each error is a (below, above) pair
+# instead of a single margin.
+
+import math
+
+import numpy as np
+
+from aggregate import METRICS, aggregate, group_keys, group_values, hybrid_code
+from bootstrap import bootstrap_intervals, interval_errors, metric_columns, proportion_errors
+from instrumentation import timed
+from matchups import MatchupMatrix
+from win_probability import win_probability_table
+
+MIN_MATCHES = 30
+
+
+def proportion_with_margin(values):
+    proportion = np.mean(values)
+    margin = 1.96 * math.sqrt(proportion * (1 - proportion) / len(values))
+    return proportion, margin
+
+
+# One point per group for the average-vs-average scatters: (label, x, y, x error, y error, character or None).
+# The character is only used to pick a color.
+def error_points(stats, x_metric, y_metric, groups):
+    points = []
+    for label, code, char in groups:
+        points.append((label, stats[x_metric]['mean'][code], stats[y_metric]['mean'][code], stats[x_metric]['ci'][code],
+                       stats[y_metric]['ci'][code], char))
+    return points
+
+
+# Replaces the normal approximation errors in data and in each grouping's stats with bootstrap errors. All the
+# groupings of player rows, and the win rates by number of early deaths, are resampled together.
+def bootstrap_errors(store, data, results, stat_groups, resamples, seed=0, workers=None):
+    data['dmg_inversion'] = data['dmg_inversion'][0], proportion_errors(
+        data['winning_damage'] < data['losing_damage'], resamples, seed)
+    data['first_stock_wins'] = data['first_stock_wins'][0], proportion_errors(results['first_stock_wins'], resamples,
+                                                                              seed)
+
+    sums, counts = metric_columns(store, METRICS)
+    groupings = [(group_keys(store, grouping)[0], [code for _, code, _ in groups], sums, counts)
+                 for grouping, _, groups in stat_groups]
+    # Each player's number of deaths at or below 100%, for the early death win rates
+    deaths = store['deaths']
+    offsets = np.asarray(deaths['offsets'])
+    early_deaths = np.add.reduceat(np.append(np.asarray(deaths['percent']) <= 100, False), offsets[:-1])
+    early_deaths[offsets[:-1] == offsets[1:]] = 0
+    won = np.asarray(store['players']['won'], dtype=np.float64)
+    groupings.append((early_deaths, [0, 1, 2], won[:, None], np.ones((len(won), 1))))
+
+    intervals = bootstrap_intervals(np.arange(len(won)) // 2, len(store), groupings, resamples, seed, workers)
+    for (_, stats, groups), (lower, upper) in zip(stat_groups, intervals):
+        codes = [code for _, code, _ in groups]
+        for k, metric in enumerate(METRICS):
+            stats[metric]['ci'] = np.full((len(stats[metric]['mean']), 2), np.nan)
+            stats[metric]['ci'][codes] = interval_errors(stats[metric]['mean'][codes], lower[:, k], upper[:, k])
+    lower, upper = intervals[-1]
+    data['win_rate_errors'] = interval_errors(np.array(data['win_rates']), lower[:, 0], upper[:, 0]).T
+
+
+# matchups is the matchup matrix kept up to date by ingest.sync, if there is one. Otherwise it's counted from the store.
+@timed('analysis.analyze')
+def analyze(store, results, min_matches=MIN_MATCHES, bootstrap=None, seed=0, workers=None, matchups=None):
+    data = {}
+    freqs = results['frequencies']
+    character_freq = freqs['character_freq']
+    character_reps = freqs['character_reps']
+    player_freq = freqs['player_freq']
+    player_char_freq = freqs['player_char_freq']
+
+    # Categorical values found in fewer than min_matches matches are left out of everything below
+    characters = sorted(filter(lambda key: character_freq[key] >= min_matches, character_freq.keys()),
+                        key=lambda key: -character_freq[key])
+    players = sorted(filter(lambda key: player_freq[key] >= min_matches, player_freq.keys()),
+                     key=lambda key: -player_freq[key])
+    player_chars = {}
+    for player in players:
+        player_chars[player] = sorted(
+            filter(lambda key: player_char_freq[player][key] >= min_matches, player_char_freq[player].keys()),
+            key=lambda key: -player_char_freq[player][key])
+
+    data['characters'] = sorted(characters)
+    data['characters_by_reps'] = sorted(data['characters'], key=lambda key: -len(character_reps[key]))
+    data['characters_by_freq'] = sorted(data['characters_by_reps'], key=lambda char: -character_freq[char])
+    data['character_freq'] = {char: character_freq[char] for char in characters}
+    data['character_reps'] = {char: len(character_reps[char]) for char in characters}
+    data['players'] = players
+    data['player_chars'] = player_chars
+
+    player_rows = store['players']
+    won = np.asarray(player_rows['won'])
+    data['winning_damage'] = player_rows['damage_dealt'][won]
+    data['losing_damage'] = player_rows['damage_dealt'][~won]
+    data['dmg_inversion'] = proportion_with_margin(data['winning_damage'] < data['losing_damage'])
+    data['losing_death_pcts'], data['winning_death_pcts'] = group_values(store, 'outcome', 'death_pcts')
+
+    char_kill_pcts = group_values(store, 'character', 'kill_pcts')
+    char_death_pcts = group_values(store, 'character', 'death_pcts')
+    data['char_kill_pcts'] = [char_kill_pcts[store.character_code(char)] for char in data['characters_by_reps']]
+    data['char_death_pcts'] = [char_death_pcts[store.character_code(char)] for char in data['characters_by_reps']]
+
+    data['first_stock_wins'] = proportion_with_margin(results['first_stock_wins'])
+    data['stock_diffs'] = results['stock_diffs']
+    data['stock_diff'] = results['stock_diff']
+    outcomes = results['outcomes'][:3]
+    data['outcomes'] = outcomes
+    data['win_rates'] = [o[1] / (o[1] + o[0]) for o in outcomes]
+    data['win_rate_errors'] = [1.96 * math.sqrt(rate * (1 - rate) / sum(outcome))
+                               for rate, outcome in zip(data['win_rates'], outcomes)]
+
+    char_stats = aggregate(store, 'character')
+    player_stats = aggregate(store, 'player')
+    hybrid_stats = aggregate(store, 'hybrid')
+    char_groups = [(char, store.character_code(char), char) for char in data['characters_by_reps']]
+    player_groups = [(player, store.player_code(player), None) for player in players]
+    hybrid_groups = [(player + "'s " + char, hybrid_code(store, player, char), char)
+                     for player in player_chars for char in player_chars[player]]
+    if bootstrap:
+        bootstrap_errors(store, data, results, [('character', char_stats, char_groups),
+                                                ('player', player_stats, player_groups),
+                                                ('hybrid', hybrid_stats, hybrid_groups)], bootstrap, seed, workers)
+    data['error_points'] = {}
+    for x_metric, y_metric in [('kill_pcts', 'death_pcts'), ('kills', 'deaths'), ('damage_dealt', 'damage_taken')]:
+        for kind, stats, groups in [('character', char_stats, char_groups), ('player', player_stats, player_groups),
+                                    ('hybrid', hybrid_stats, hybrid_groups)]:
+            data['error_points'][x_metric, kind] = error_points(stats, x_metric, y_metric, groups)
+
+    # Matchup win rates and counts, in order of character popularity, and the same for the whole roster
+    matchups = matchups or MatchupMatrix.from_store(store)
+    wins, counts = matchups.table(data['characters_by_freq'])
+    with np.errstate(invalid='ignore'):
+        data['mu_arr'] = wins / counts
+    data['mu_count'] = counts
+    data['roster'] = matchups.characters()
+    wins, counts = matchups.table(data['roster'])
+    with np.errstate(invalid='ignore'):
+        data['roster_mu_arr'] = wins / counts
+
+    # Chance that a player who just lost their first or second stock wins, by the opponent's stocks lost and damage
+    data['win_probability'] = win_probability_table(store)['prob']
+    return data
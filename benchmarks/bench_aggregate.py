@@ -0,0 +1,99 @@
+# Times the grouped aggregation engine against the per-match loop api_test.py used to fill its dicts of lists, at 1x,
+# 10x and 100x a base sample of matches, and checks that both give the same means and standard deviations. Run from
+# the repository root with: python -m benchmarks.bench_aggregate [base number of matches]
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from aggregate import aggregate, hybrid_code
+from benchmarks.synthetic import make_archive, archive_matches
+from match_store import build_store
+
+SCALES = [1, 10, 100]
+
+
+# The second sweep over matches as it was written in api_test.py, with every group kept
+def legacy_sweep(matches):
+    char_stats = {}
+    player_stats = {}
+    hybrid_stats = {}
+    for match in matches:
+        kill_pcts = [[], []]
+        death_pcts = [[], []]
+        kills = [0, 0]
+        deaths = [0, 0]
+        damage_dealt = [0, 0]
+        damage_taken = [0, 0]
+        player_arr = [None, None]
+        character_arr = [None, None]
+
+        for player_data in match['players'].values():
+            i = 0 if player_data['player'] == 1 else 1
+            player_arr[i] = player_data['player_tag']
+            character_arr[i] = player_data['character']['internal_name']
+
+        for i in range(2):
+            for stock in match['stock_stats'][str(i + 1)].values():
+                damage_dealt[i] += stock['damage_dealt']
+                damage_taken[1 - i] += stock['damage_dealt']
+                if 'death_percent' in stock:
+                    death_pcts[i].append(stock['death_percent'])
+                    kill_pcts[1 - i].append(stock['death_percent'])
+                    deaths[i] += 1
+                    kills[1 - i] += 1
+
+        for i in range(2):
+            for stats, key in [(char_stats, character_arr[i]), (player_stats, player_arr[i]),
+                               (hybrid_stats, (player_arr[i], character_arr[i]))]:
+                if key not in stats:
+                    stats[key] = {'kill_pcts': [], 'death_pcts': [], 'kills': [], 'deaths': [], 'damage_dealt': [],
+                                  'damage_taken': []}
+                stats[key]['kill_pcts'].extend(kill_pcts[i])
+                stats[key]['death_pcts'].extend(death_pcts[i])
+                stats[key]['kills'].append(kills[i])
+                stats[key]['deaths'].append(deaths[i])
+                stats[key]['damage_dealt'].append(damage_dealt[i])
+                stats[key]['damage_taken'].append(damage_taken[i])
+
+    for stats in [char_stats, player_stats, hybrid_stats]:
+        for metrics in stats.values():
+            for metric, values in metrics.items():
+                metrics[metric] = (np.mean(values), np.std(values))
+    return char_stats, player_stats, hybrid_stats
+
+
+def check(store, legacy, engine):
+    for (legacy_stats, code), engine_stats in zip([(legacy[0], store.character_code), (legacy[1], store.player_code),
+                                                   (legacy[2], lambda key: hybrid_code(store, *key))], engine):
+        for key, metrics in legacy_stats.items():
+            for metric, (mean, std) in metrics.items():
+                assert np.isclose(engine_stats[metric]['mean'][code(key)], mean), (key, metric)
+                assert np.isclose(engine_stats[metric]['std'][code(key)], std), (key, metric)
+
+
+base = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+tournaments, details, flat_matches = make_archive(num_tournaments=max(1, base // 100), sets_per_tournament=30)
+sample = archive_matches(details)[:base]
+
+print('%8s %10s %10s %10s %10s' % ('matches', 'legacy s', 'store s', 'engine s', 'speedup'))
+with tempfile.TemporaryDirectory() as directory:
+    for scale in SCALES:
+        matches = sample * scale
+        start = time.perf_counter()
+        legacy = legacy_sweep(matches)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = build_store(matches, directory + '/columns')
+        store_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine = [aggregate(store, grouping) for grouping in ['character', 'player', 'hybrid']]
+        engine_time = time.perf_counter() - start
+
+        check(store, legacy, engine)
+        print('%8d %10.3f %10.3f %10.3f %9.1fx' % (len(matches), legacy_time, store_time, engine_time,
+                                                   legacy_time / engine_time))
@@ -0,0 +1,44 @@
+# Times bootstrap confidence intervals for every group of every grouping the error plots use, resampled together, and
+# checks that the intervals come out the same whatever the number of worker processes. Run from the repository root
+# with: python -m benchmarks.bench_bootstrap [number of matches] [resamples] [workers]
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from aggregate import METRICS, aggregate, group_keys
+from benchmarks.synthetic import make_archive, archive_matches
+from bootstrap import bootstrap_intervals, metric_columns
+from match_store import build_store
+
+num_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+resamples = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+tournaments, details, flat_matches = make_archive(num_tournaments=max(1, num_matches // 150), sets_per_tournament=40)
+store = build_store(iter(archive_matches(details)[:num_matches]), tempfile.mkdtemp())
+
+sums, counts = metric_columns(store, METRICS)
+row_matches = np.arange(len(sums)) // 2
+names = ['character', 'player', 'hybrid']
+groupings = []
+for grouping in names:
+    keys, _ = group_keys(store, grouping)
+    groupings.append((keys, np.unique(keys), sums, counts))
+
+start = time.perf_counter()
+intervals = bootstrap_intervals(row_matches, len(store), groupings, resamples, seed=0, workers=workers)
+seconds = time.perf_counter() - start
+
+print('%d matches, %d resamples, %d workers: %.2f s for %d groups' %
+      (len(store), resamples, workers, seconds, sum(len(codes) for _, codes, _, _ in groupings)))
+for grouping, (_, codes, _, _), (lower, upper) in zip(names, groupings, intervals):
+    column = METRICS.index('damage_dealt')
+    normal = np.nanmean(aggregate(store, grouping)['damage_dealt']['ci'][codes])
+    print('%-9s %4d groups, mean damage dealt half-width: normal %.2f, bootstrap %.2f' %
+          (grouping, len(codes), normal, np.nanmean(upper[:, column] - lower[:, column]) / 2))
+
+check = [bootstrap_intervals(row_matches, len(store), groupings, 1000, seed=0, workers=n) for n in (1, 2)]
+assert all(np.allclose(a, b, equal_nan=True) for one, two in zip(*check) for a, b in zip(one, two))
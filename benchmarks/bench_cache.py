@@ -0,0 +1,74 @@
+# Compares a cold run, a warm run served from the response cache, a run where every entry has expired and has to be
+# revalidated, and an offline run. Then checks that a sync through the cache picks up sets published to a tournament
+# it has already synced, whose details are still fresh in the cache. Run from the repository root with:
+# python -m benchmarks.bench_cache
+
+import contextlib
+import io
+import tempfile
+import time
+
+import metascouter_api
+from benchmarks.stub_server import start_stub_server, use_stub
+from benchmarks.synthetic import make_archive, make_responder
+from ingest import load_state, sync
+from response_cache import ResponseCache
+
+NUM_REQUESTS = 400
+LATENCY = 0.02
+
+
+def echo_path(path):
+    return {'path': path, 'results': [{'id': i} for i in range(20)]}
+
+
+server = start_stub_server(echo_path, latency=LATENCY)
+use_stub(server)
+urls = ['sets/%d/matches/' % i for i in range(NUM_REQUESTS)]
+
+with tempfile.TemporaryDirectory() as directory:
+    metascouter_api.cache = ResponseCache(directory)
+    print('%d requests, %.0f ms latency each' % (NUM_REQUESTS, LATENCY * 1000))
+    print('%12s %10s %10s %8s' % ('run', 'seconds', 'requests', '304s'))
+
+    def run(name):
+        requests_before, not_modified_before = server.request_count, server.not_modified_count
+        start = time.perf_counter()
+        results = metascouter_api.api_request_many(urls)
+        elapsed = time.perf_counter() - start
+        assert [result['path'] for result in results] == ['/ssbu/' + url for url in urls]
+        print('%12s %10.3f %10d %8d' % (name, elapsed, server.request_count - requests_before,
+                                          server.not_modified_count - not_modified_before))
+
+    run('cold')
+    run('warm')
+    metascouter_api.cache.default_ttl = 0
+    metascouter_api.cache.ttls = []
+    run('revalidate')
+    metascouter_api.offline = True
+    run('offline')
+    metascouter_api.offline = False
+
+server.shutdown()
+
+# Tournament 1 is synced with 5 of its sets published. Once the other 5 are, its list entry changes, which is all a
+# sync has to go on.
+tournaments, details, flat_matches = make_archive(num_tournaments=4, sets_per_tournament=10)
+all_sets = details[1]['sets']
+details[1] = dict(details[1], sets=all_sets[:5])
+server = start_stub_server(make_responder(tournaments, details.get, flat_matches.get))
+use_stub(server)
+with tempfile.TemporaryDirectory() as directory:
+    metascouter_api.cache = ResponseCache(directory + '/cache')
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync(tournaments, directory, processes=1)
+        assert len(load_state(directory)['sets']) == 35
+        details[1] = dict(details[1], sets=all_sets)
+        tournaments[0] = dict(tournaments[0], set_count=len(all_sets))
+        sync(tournaments, directory, processes=1)
+        sync(tournaments, directory, processes=1)
+    num_sets = len(load_state(directory)['sets'])
+    assert num_sets == 40, num_sets
+    print('sets published to a synced tournament: picked up by the next sync')
+
+server.shutdown()
@@ -0,0 +1,31 @@
+# Measures how API throughput scales with the number of concurrent requests, against a local stub server that adds a
+# fixed latency to every response. Run from the repository root with: python -m benchmarks.bench_fetch
+
+import time
+
+import metascouter_api
+from benchmarks.stub_server import start_stub_server, use_stub
+
+NUM_REQUESTS = 400
+LATENCY = 0.02
+
+
+def echo_path(path):
+    return {'path': path, 'results': []}
+
+
+server = start_stub_server(echo_path, latency=LATENCY, fail_every=50)
+use_stub(server)
+metascouter_api.BACKOFF = 0.01
+urls = ['sets/%d/matches/' % i for i in range(NUM_REQUESTS)]
+
+print('%d requests, %.0f ms latency each, every 50th request answered with a 503' % (NUM_REQUESTS, LATENCY * 1000))
+print('%8s %10s %12s' % ('workers', 'seconds', 'requests/s'))
+for workers in [1, 2, 4, 8, 16, 32]:
+    start = time.perf_counter()
+    results = metascouter_api.api_request_many(urls, workers)
+    elapsed = time.perf_counter() - start
+    assert [result['path'] for result in results] == ['/ssbu/' + url for url in urls]
+    print('%8d %10.2f %12.1f' % (workers, elapsed, NUM_REQUESTS / elapsed))
+
+server.shutdown()
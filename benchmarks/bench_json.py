@@ -0,0 +1,66 @@
+# Compares the ways of decoding stored matches: the standard json module, orjson (if installed), and
+# fast_json.loads_match, which parses the time series straight into NumPy arrays. Real health_data holds far more
+# samples than the synthetic matches, so each player's damage is resampled every SAMPLE_INTERVAL seconds first (see
+# synthetic.resample_health). Reports
+# the time to decode a thousand matches, the memory the decoded matches hold (as counted by tracemalloc, which NumPy
+# reports its arrays to), and the time to flatten them into columns with match_store.normalize. Also checks that a
+# series of samples that aren't pairs is decoded as is. Run from the repository root with:
+# python -m benchmarks.bench_json [sample interval]
+
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import fast_json
+from benchmarks.synthetic import make_archive, archive_matches, resample_health
+from match_store import normalize
+
+NUM_MATCHES = 1000
+SAMPLE_INTERVAL = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+
+
+matches = archive_matches(make_archive(num_tournaments=8, sets_per_tournament=40)[1])[:NUM_MATCHES]
+for match in matches:
+    resample_health(match, SAMPLE_INTERVAL)
+lines = [json.dumps(match).encode() for match in matches]
+samples = sum(len(data['health_data']) for match in matches for data in match['stats']['event_data'])
+print('%d matches, %.0f health samples and %.0f KB each' % (len(lines), samples / len(lines),
+                                                            sum(map(len, lines)) / len(lines) / 1024))
+
+# A series whose samples aren't [time, value] pairs has to come back as decoded, not re-paired
+wide = json.loads(lines[0])
+wide['stats']['event_data'][0]['stock_data'] = [[1, 2, 9], [3, 4, 9]]
+decoded = fast_json.loads_match(json.dumps(wide).encode())['stats']['event_data'][0]['stock_data']
+assert np.asarray(decoded).tolist() == [[1, 2, 9], [3, 4, 9]], decoded
+
+decoders = [('json', json.loads)]
+if fast_json.orjson:
+    decoders.append(('orjson', fast_json.orjson.loads))
+decoders.append(('loads_match', fast_json.loads_match))
+print('%12s %16s %18s %16s' % ('', 'decode (s/1000)', 'memory (MB/1000)', 'normalize (s)'))
+expected = None
+for name, decode in decoders:
+    start = time.perf_counter()
+    decoded = [decode(line) for line in lines]
+    decode_time = time.perf_counter() - start
+    del decoded
+
+    tracemalloc.start()
+    decoded = [decode(line) for line in lines]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    arrays, _ = normalize(decoded)
+    normalize_time = time.perf_counter() - start
+    if expected is None:
+        expected = arrays
+    assert all(np.array_equal(arrays[table][column], expected[table][column], equal_nan=True)
+               for table in arrays for column in arrays[table])
+    del decoded
+    per_thousand = 1000 / len(lines)
+    print('%12s %16.3f %18.1f %16.3f' % (name, decode_time * per_thousand, memory / 1024 / 1024 * per_thousand,
+                                         normalize_time))
@@ -0,0 +1,65 @@
+# Times the matchup matrix three ways over a full roster: the per-match Python loop analysis.py used to run, counting
+# it from the store's columns in one go, and adding matches one at a time as a sync would. Also merges partial matrices
+# built over shards of the matches and checks every version agrees. Run from the repository root with:
+# python -m benchmarks.bench_matchups [number of matches] [number of characters] [shards]
+
+import sys
+import time
+
+import numpy as np
+
+from matchups import MatchupMatrix
+
+num_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+num_characters = int(sys.argv[2]) if len(sys.argv) > 2 else 86
+shards = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+rng = np.random.default_rng(0)
+names = ['character%d' % i for i in range(num_characters)]
+# Character popularity is heavily skewed, like the real roster
+popularity = 1 / np.arange(1, num_characters + 1)
+characters = rng.choice(num_characters, size=(num_matches, 2), p=popularity / popularity.sum())
+deaths1 = np.where(rng.random(num_matches) < 0.5, 3, rng.integers(0, 3, num_matches))
+
+start = time.perf_counter()
+wins = np.zeros((num_characters, num_characters))
+counts = np.zeros((num_characters, num_characters), dtype=np.int64)
+for (code1, code2), death_count in zip(characters, deaths1):
+    winner, loser = (code2, code1) if death_count == 3 else (code1, code2)
+    wins[winner, loser] += 1
+    counts[code1, code2] += 1
+    counts[code2, code1] += 1
+loop_time = time.perf_counter() - start
+
+start = time.perf_counter()
+player1_lost = deaths1 == 3
+matrix = MatchupMatrix(names)
+matrix.add_codes(np.where(player1_lost, characters[:, 1], characters[:, 0]),
+                 np.where(player1_lost, characters[:, 0], characters[:, 1]))
+columns_time = time.perf_counter() - start
+
+start = time.perf_counter()
+incremental = MatchupMatrix()
+for (code1, code2), lost in zip(characters.tolist(), player1_lost.tolist()):
+    if lost:
+        incremental.add(names[code2], names[code1])
+    else:
+        incremental.add(names[code1], names[code2])
+incremental_time = time.perf_counter() - start
+
+start = time.perf_counter()
+merged = MatchupMatrix()
+for shard in np.array_split(np.arange(num_matches), shards):
+    partial = MatchupMatrix(names)
+    partial.add_codes(np.where(player1_lost[shard], characters[shard, 1], characters[shard, 0]),
+                      np.where(player1_lost[shard], characters[shard, 0], characters[shard, 1]))
+    merged.merge(partial)
+merge_time = time.perf_counter() - start
+
+assert np.array_equal(matrix.wins, wins) and np.array_equal(matrix.table(names)[1], counts)
+assert np.array_equal(incremental.table(names)[0], wins) and np.array_equal(merged.table(names)[0], wins)
+print('%d matches, %d characters' % (num_matches, num_characters))
+print('per-match loop:             %.3f s' % loop_time)
+print('counted from columns:       %.3f s' % columns_time)
+print('added one match at a time:  %.3f s (%.2f us per match)' % (incremental_time,
+                                                                  incremental_time / num_matches * 1e6))
+print('%d shards merged:            %.3f s' % (shards, merge_time))
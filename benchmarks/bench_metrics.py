@@ -0,0 +1,29 @@
+# Compares running every registered metric in one fused pass against one pass per metric, the way api_test.py used
+# to. Run from the repository root with: python -m benchmarks.bench_metrics [number of matches]
+
+import sys
+import time
+
+from benchmarks.synthetic import make_archive, archive_matches
+from metrics import METRICS, run_metrics
+from models import models_from_dicts
+
+num_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+tournaments, details, flat_matches = make_archive(num_tournaments=max(1, num_matches // 150), sets_per_tournament=40)
+sources = {'matches': list(models_from_dicts(archive_matches(details)[:num_matches])),
+           'matches_flat': [match for matches in flat_matches.values() for match in matches][:num_matches]}
+
+start = time.perf_counter()
+separate = {}
+for name in METRICS:
+    separate.update(run_metrics(sources, [name]))
+separate_time = time.perf_counter() - start
+
+start = time.perf_counter()
+fused = run_metrics(sources)
+fused_time = time.perf_counter() - start
+
+assert fused == separate
+print('%d matches, %d metrics' % (len(sources['matches']), len(METRICS)))
+print('one pass per metric: %.3f s' % separate_time)
+print('fused pass:          %.3f s' % fused_time)
@@ -0,0 +1,74 @@
+# Compares the stored matches as decoded JSON dicts with the same matches as models.Match objects over the columnar
+# store: the memory a list of each takes per match (traced with tracemalloc, so the store's memory-mapped columns, which
+# the time series views point into, aren't counted), and the fused metric pass over every stored match read each way,
+# checking both give the same results. health_data is resampled every SAMPLE_INTERVAL seconds, as in bench_json, so
+# the matches are about the size of real ones. Run from the repository root with:
+# python -m benchmarks.bench_models [number of tournaments] [sample interval]
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.stub_server import start_stub_server, use_stub
+from benchmarks.synthetic import make_archive, archive_matches, archive_responder, resample_health
+from fast_json import loads
+from ingest import iter_matches, load_columns, load_state, read_range, run_metrics_sharded, sync, MATCHES_FILE
+from match_store import OFFSET_FILE
+from models import iter_models
+
+num_tournaments = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+SAMPLE_INTERVAL = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+tournaments, details, flat_matches = make_archive(num_tournaments=num_tournaments, sets_per_tournament=40)
+for match in archive_matches(details):
+    resample_health(match, SAMPLE_INTERVAL)
+server = start_stub_server(archive_responder(tournaments, details, flat_matches))
+use_stub(server)
+data_dir = tempfile.mkdtemp()
+with contextlib.redirect_stdout(io.StringIO()):
+    sync(tournaments, data_dir, workers=8, processes=1)
+server.shutdown()
+state = load_state(data_dir)
+store = load_columns(data_dir)
+num_matches = len(store)
+
+
+# Bytes per match held by the list that load returns
+def traced(load):
+    tracemalloc.start()
+    values = load()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del values
+    return size / num_matches
+
+
+print('%d matches' % num_matches)
+print('%28s %12s' % ('representation', 'KB per match'))
+print('%28s %12.2f' % ('dicts', traced(lambda: list(iter_matches(data_dir, state))) / 1024))
+print('%28s %12.2f' % ('models', traced(lambda: list(iter_models(store))) / 1024))
+
+
+def metric_pass():
+    start = time.perf_counter()
+    results = run_metrics_sharded(data_dir, processes=1, state=state)
+    return time.perf_counter() - start, results
+
+
+# Reading every match off disk and decoding it, for comparison with both passes
+start = time.perf_counter()
+for match in read_range(data_dir, MATCHES_FILE, 0, state['offsets'][MATCHES_FILE], loads):
+    pass
+decode_time = time.perf_counter() - start
+store_time, store_results = metric_pass()
+# Without the offset the store covers, the metric pass can't trust it and normalizes the matches file instead
+os.remove(os.path.join(data_dir, 'columns', OFFSET_FILE))
+file_time, file_results = metric_pass()
+assert store_results == file_results
+print('%28s %12s %12s' % ('metric pass', 'seconds', 'matches/s'))
+for name, seconds in [('decoding alone', decode_time), ('from the matches file', file_time),
+                      ('from the store', store_time)]:
+    print('%28s %12.2f %12.0f' % (name, seconds, num_matches / seconds))
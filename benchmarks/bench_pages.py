@@ -0,0 +1,43 @@
+# Measures how much prefetching the next page saves when reading a paginated list endpoint, against a local stub
+# server that adds a fixed latency to every response, with the consumer spending a similar time on each page. Run from
+# the repository root with: python -m benchmarks.bench_pages
+
+import time
+
+import metascouter_api
+from benchmarks.stub_server import start_stub_server, use_stub
+from benchmarks.synthetic import list_page
+
+NUM_RESULTS = 2000
+PAGE_SIZE = 50
+LATENCY = 0.02
+WORK = 0.02
+
+results = [{'id': i} for i in range(NUM_RESULTS)]
+server = start_stub_server(lambda path: list_page(path, results, PAGE_SIZE), latency=LATENCY)
+use_stub(server)
+
+
+# Reads every page, asking for each one only once the previous one has been processed
+def serial_results(url):
+    while url:
+        page = metascouter_api.api_request(url)
+        yield from page['results']
+        url = page['next'] and metascouter_api.link_endpoint(page['next'])
+
+
+print('%d results in pages of %d, %.0f ms latency and %.0f ms of work per page' %
+      (NUM_RESULTS, PAGE_SIZE, LATENCY * 1000, WORK * 1000))
+print('%10s %10s' % ('', 'seconds'))
+for name, stream in [('serial', serial_results), ('prefetch', metascouter_api.api_results)]:
+    start = time.perf_counter()
+    seen = []
+    for result in stream('tournaments'):
+        seen.append(result)
+        if len(seen) % PAGE_SIZE == 0:
+            time.sleep(WORK)
+    elapsed = time.perf_counter() - start
+    assert seen == results
+    print('%10s %10.2f' % (name, elapsed))
+
+server.shutdown()
@@ -0,0 +1,72 @@
+# Times filtered lookups through query.py's index against the same filters as full scans over the store's columns, and
+# checks that both find the same rows. Run from the repository root with:
+# python -m benchmarks.bench_query [number of matches]
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_archive, archive_matches
+from match_store import build_store
+from query import build_index, summarize
+
+REPEATS = 20
+
+
+def scan_rows(store, player=None, character=None, opponent_character=None, tournaments=None):
+    players = store['players']
+    mask = np.ones(len(players['match']), dtype=bool)
+    if player is not None:
+        mask &= np.asarray(players['player']) == store.player_code(player)
+    if character is not None:
+        mask &= np.asarray(players['character']) == store.character_code(character)
+    if opponent_character is not None:
+        opponents = np.asarray(players['character']).reshape(-1, 2)[:, ::-1].ravel()
+        mask &= opponents == store.character_code(opponent_character)
+    if tournaments is not None:
+        mask &= np.isin(np.repeat(np.asarray(store['matches']['tournament']), 2), tournaments)
+    return np.flatnonzero(mask)
+
+
+def best_time(function):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+num_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+# A multi-year archive has far more players than the default synthetic one
+tournaments, details, flat_matches = make_archive(num_tournaments=max(1, num_matches // 150), sets_per_tournament=40,
+                                                  num_players=max(20, num_matches // 100))
+matches = archive_matches(details)[:num_matches]
+set_tournaments = {t_set['id']: tid for tid, detail in details.items() for t_set in detail['sets']}
+store = build_store(iter(matches), tempfile.mkdtemp(), set_tournaments)
+
+start = time.perf_counter()
+index = build_index(store)
+print('%d matches, index built in %.3f s' % (len(store), time.perf_counter() - start))
+
+player = store.player_names[0]
+character = store.character_names[store['players']['character'][0]]
+opponent_character = store.character_names[store['players']['character'][1]]
+queries = [
+    ('player', {'player': player}),
+    ('player + character', {'player': player, 'character': character}),
+    ('character pair', {'character': character, 'opponent_character': opponent_character}),
+    ('one tournament', {'tournaments': [len(tournaments) // 2]}),
+    ('player + pair + tournaments', {'player': player, 'character': character,
+                                     'opponent_character': opponent_character,
+                                     'tournaments': list(range(1, len(tournaments) // 4))}),
+]
+for name, filters in queries:
+    scan_time, expected = best_time(lambda: scan_rows(store, **filters))
+    index_time, rows = best_time(lambda: index.rows(**filters))
+    summary_time, _ = best_time(lambda: summarize(store, rows))
+    assert np.array_equal(rows, expected)
+    print('%-28s %6d rows: scan %.2f ms, index %.2f ms (+ %.2f ms to summarize)' %
+          (name, len(rows), scan_time * 1000, index_time * 1000, summary_time * 1000))
@@ -0,0 +1,44 @@
+# Times the winning vs. losing damage scatter drawn the old way, one plt.scatter call per point, against the batched
+# report.damage_scatter, at growing point counts. Past report.DENSITY_THRESHOLD points the batched version switches to
+# a hexbin. The per-point loop is only timed up to 10k points. Run from the repository root with:
+# python -m benchmarks.bench_scatter [largest number of points]
+
+import io
+import sys
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+
+from report import damage_scatter
+
+LOOP_LIMIT = 10000
+
+
+def per_point_scatter(data):
+    fig = plt.figure()
+    plt.xlim(0, 600)
+    plt.ylim(0, 600)
+    for w, l in zip(data['winning_damage'], data['losing_damage']):
+        plt.scatter(w, l, c='blue' if w >= l else 'purple')
+    return fig
+
+
+def time_render(draw, data):
+    start = time.perf_counter()
+    fig = draw(data)
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+largest = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+rng = np.random.default_rng(0)
+n = 1000
+while n <= largest:
+    data = {'winning_damage': rng.uniform(0, 400, n), 'losing_damage': rng.uniform(50, 500, n)}
+    loop = '%.3f s' % time_render(per_point_scatter, data) if n <= LOOP_LIMIT else '-'
+    print('%8d points: per point %9s, batched %.3f s' % (n, loop, time_render(damage_scatter, data)))
+    n *= 10
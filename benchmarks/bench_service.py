@@ -0,0 +1,88 @@
+# Runs service.py over a synthetic archive served by a local stub server, and times
+#
+#     - GETs of each endpoint, the first time (computed) and again (cached), and with the ETag (304)
+#     - folding newly published tournaments in with StatsService.update, against rebuilding the columnar store and
+#       rerunning every metric from scratch
+#
+# checking after every update that the results in memory are identical to a full recompute. Run from the repository
+# root with:
+# python -m benchmarks.bench_service [tournaments at start] [tournaments per update] [updates]
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.stub_server import start_stub_server, use_stub
+from benchmarks.synthetic import make_archive, make_responder
+from ingest import build_columns, iter_matches, load_state, run_metrics_sharded, sync
+from match_store import normalize
+from service import StatsService, start_service
+
+ENDPOINTS = ['status', 'stats/character', 'stats/player', 'stats/hybrid?min_matches=5', 'matchups', 'stocks',
+             'metrics/frequencies', 'query?player=player0&by=opponent', 'query?character=fox&by=tournament']
+REPEATS = 20
+
+num_tournaments = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+batch = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+num_updates = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+tournaments, details, flat_matches = make_archive(num_tournaments=num_tournaments + batch * num_updates,
+                                                  sets_per_tournament=40)
+# The stub serves whatever is in this list, so tournaments are published by appending to it
+published = tournaments[:num_tournaments]
+server = start_stub_server(make_responder(published, details.get, flat_matches.get, page_size=50))
+use_stub(server)
+data_dir = tempfile.mkdtemp()
+with contextlib.redirect_stdout(io.StringIO()):
+    sync(published, data_dir, workers=8, processes=1)
+    start = time.perf_counter()
+    service = StatsService(data_dir, processes=1)
+    startup = time.perf_counter() - start
+service_server = start_service(service)
+url = 'http://127.0.0.1:%d/' % service_server.server_address[1]
+session = requests.Session()
+print('%d matches from %d tournaments, service up in %.2f s' % (len(service.data['store']), num_tournaments, startup))
+
+
+def get_ms(endpoint, headers=None):
+    start = time.perf_counter()
+    response = session.get(url + endpoint, headers=headers)
+    return (time.perf_counter() - start) * 1000, response
+
+
+print('%36s %10s %10s %10s %10s' % ('endpoint', 'first ms', 'cached ms', '304 ms', 'KB'))
+for endpoint in ENDPOINTS:
+    first, response = get_ms(endpoint)
+    assert response.status_code == 200, (endpoint, response.text)
+    cached = min(get_ms(endpoint)[0] for _ in range(REPEATS))
+    not_modified = min(get_ms(endpoint, {'If-None-Match': response.headers['ETag']})[0] for _ in range(REPEATS))
+    assert get_ms(endpoint, {'If-None-Match': response.headers['ETag']})[1].status_code == 304
+    print('%36s %10.1f %10.2f %10.2f %10.1f' % (endpoint, first, cached, not_modified, len(response.content) / 1024))
+
+print('%8s %10s %12s %12s' % ('update', 'matches', 'update (s)', 'full (s)'))
+for update in range(num_updates):
+    published.extend(tournaments[len(published):len(published) + batch])
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert service.update()
+    update_time = time.perf_counter() - start
+
+    state = load_state(data_dir)
+    start = time.perf_counter()
+    build_columns(data_dir, state, 1, incremental=False)
+    expected = run_metrics_sharded(data_dir, 1, state=state)
+    full_time = time.perf_counter() - start
+    assert service.data['results'] == expected
+    set_tournaments = {int(set_id): tid for set_id, tid in state['sets'].items()}
+    arrays, _ = normalize(iter_matches(data_dir, state), set_tournaments)
+    store = service.data['store']
+    assert all(np.array_equal(np.asarray(store[name][column]), values, equal_nan=True)
+               for name, columns in arrays.items() for column, values in columns.items())
+    print('%8d %10d %12.2f %12.2f' % (update + 1, len(store), update_time, full_time))
+
+service_server.shutdown()
+server.shutdown()
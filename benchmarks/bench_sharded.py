@@ -0,0 +1,60 @@
+# Syncs a synthetic archive from a local stub server, then times rebuilding the columnar store and running every
+# metric with the stored matches split by tournament across 1, 2, 4, ... processes, checking the results are identical
+# to a single pass each time. Run from the repository root with:
+# python -m benchmarks.bench_sharded [number of tournaments] [most processes]
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stub_server import start_stub_server, use_stub
+from benchmarks.synthetic import make_archive, archive_responder
+from ingest import build_columns, iter_matches, iter_matches_flat, load_state, run_metrics_sharded, sync
+from match_store import normalize
+from metrics import run_metrics
+from models import models_from_dicts
+
+num_tournaments = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+most_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+tournaments, details, flat_matches = make_archive(num_tournaments=num_tournaments, sets_per_tournament=40)
+server = start_stub_server(archive_responder(tournaments, details, flat_matches))
+use_stub(server)
+data_dir = tempfile.mkdtemp()
+with contextlib.redirect_stdout(io.StringIO()):
+    sync(tournaments, data_dir, workers=8, processes=1)
+server.shutdown()
+state = load_state(data_dir)
+
+set_tournaments = {int(set_id): tid for set_id, tid in state['sets'].items()}
+start = time.perf_counter()
+arrays, vocab = normalize(iter_matches(data_dir, state), set_tournaments)
+single_store = time.perf_counter() - start
+start = time.perf_counter()
+expected = run_metrics({'matches': models_from_dicts(iter_matches(data_dir, state)),
+                        'matches_flat': iter_matches_flat(data_dir, state)})
+single_metrics = time.perf_counter() - start
+num_matches = len(arrays['matches']['set'])
+print('%d matches from %d tournaments on %d cores' % (num_matches, num_tournaments, os.cpu_count()))
+print('%9s %12s %14s %12s %14s' % ('processes', 'store (s)', 'matches/s', 'metrics (s)', 'matches/s'))
+print('%9s %12.2f %14.0f %12.2f %14.0f' % ('single', single_store, num_matches / single_store, single_metrics,
+                                          num_matches / single_metrics))
+
+processes = 1
+while processes <= most_processes:
+    start = time.perf_counter()
+    store = build_columns(data_dir, state, processes, incremental=False)
+    store_time = time.perf_counter() - start
+    start = time.perf_counter()
+    results = run_metrics_sharded(data_dir, processes, state=state)
+    metrics_time = time.perf_counter() - start
+    assert all(np.array_equal(np.asarray(store[name][column]), values, equal_nan=True)
+               for name, columns in arrays.items() for column, values in columns.items())
+    assert results == expected
+    print('%9d %12.2f %14.0f %12.2f %14.0f' % (processes, store_time, num_matches / store_time, metrics_time,
+                                              num_matches / metrics_time))
+    processes *= 2
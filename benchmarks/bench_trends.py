@@ -0,0 +1,63 @@
+# Times trends.trend_table, which slides its windows over running sums, against recomputing every window from its own
+# matches with aggregate.group_stats, over a synthetic archive of several years of tournaments (one a week), and checks
+# both give the same numbers. Run from the repository root with:
+# python -m benchmarks.bench_trends [number of tournaments] [rolling window size]
+
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from aggregate import group_keys, group_stats, metric_values, METRICS
+from benchmarks.synthetic import make_tournament
+from match_store import build_store
+from trends import trend_table, tournament_order, window_spans
+
+num_tournaments = int(sys.argv[1]) if len(sys.argv) > 1 else 520
+size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+tournaments = {}
+matches = []
+set_tournaments = {}
+for tid in range(1, num_tournaments + 1):
+    entry, detail, _ = make_tournament(tid, sets_per_tournament=40)
+    tournaments[tid] = entry
+    for t_set in detail['sets']:
+        set_tournaments[t_set['id']] = tid
+        matches.extend(t_set['matches'])
+directory = tempfile.mkdtemp()
+store = build_store(matches, directory, set_tournaments)
+del matches
+print('%d matches from %d tournaments, %s to %s' % (len(store), num_tournaments, tournaments[1]['start_date'],
+                                                    tournaments[num_tournaments]['start_date']))
+
+
+# Every window's group_stats over the rows of the tournaments in it
+def recompute(metric, window):
+    tids, dates, match_events = tournament_order(store, tournaments)
+    spans = window_spans(tids, dates, window, size)
+    rows, values = metric_values(store, metric)
+    keys, num_groups = group_keys(store, 'character')
+    events = match_events[rows // 2]
+    keys = keys[rows]
+    return [group_stats(keys[(events >= first) & (events < last)], values[(events >= first) & (events < last)],
+                        num_groups) for _, first, last in spans]
+
+
+print('%12s %10s %8s %14s %14s' % ('metric', 'window', 'windows', 'sliding (s)', 'recompute (s)'))
+for window in ['rolling', 'month', 'tournament']:
+    for metric in METRICS:
+        start = time.perf_counter()
+        table = trend_table(store, tournaments, metric, 'character', window, size, top=len(store.character_names))
+        sliding = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = recompute(metric, window)
+        recomputed = time.perf_counter() - start
+        codes = [store.character_code(char) for char in table['groups']]
+        for i, stats in enumerate(expected):
+            assert np.array_equal(table['count'][i], stats['count'][codes])
+            for key in ('mean', 'std', 'ci'):
+                assert np.allclose(table[key][i], stats[key][codes], equal_nan=True)
+        print('%12s %10s %8d %14.3f %14.3f' % (metric, window, len(expected), sliding, recomputed))
+shutil.rmtree(directory)
@@ -0,0 +1,58 @@
+# Compares building the win probability table by walking every match's health_data with index pointers, the way the
+# original match_state sketch in api_test.py did, against win_probability.py's searchsorted over the columnar store.
+# Run from the repository root with: python -m benchmarks.bench_win_probability [number of matches]
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_archive, archive_matches
+from match_store import build_store
+from win_probability import BIN_WIDTH, MAX_DEATHS, MAX_STOCKS_LOST, NUM_BINS, win_probability_table
+
+
+# Records, for each of the first two deaths of the player in slot me, the opponent's stocks lost and damage bin
+def walk_deaths(match_state, event_data, me, won):
+    health_data = event_data[1 - me]['health_data']
+    idx = 0
+    stocks_lost = 0
+    for death_num in range(min(MAX_DEATHS, len(event_data[me]['health_at_death_data']))):
+        death_time = event_data[me]['health_at_death_data'][death_num][0]
+        while idx < len(health_data) - 1 and health_data[idx + 1][0] < death_time:
+            idx += 1
+            if health_data[idx][1] == 0:
+                stocks_lost += 1
+        if stocks_lost == MAX_STOCKS_LOST:
+            break
+        match_state[death_num][stocks_lost][min(NUM_BINS - 1, int(health_data[idx][1] // BIN_WIDTH))].append(won)
+
+
+def pointer_table(matches):
+    match_state = [[[[] for _ in range(NUM_BINS)] for _ in range(MAX_STOCKS_LOST)] for _ in range(MAX_DEATHS)]
+    for match in matches:
+        event_data = match['stats']['event_data']
+        p1_wins = len(event_data[1]['health_at_death_data']) == 3
+        walk_deaths(match_state, event_data, 0, p1_wins)
+        walk_deaths(match_state, event_data, 1, not p1_wins)
+    return np.array([[[np.mean(wins) if wins else np.nan for wins in row] for row in death] for death in match_state])
+
+
+num_matches = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+tournaments, details, flat_matches = make_archive(num_tournaments=max(1, num_matches // 150), sets_per_tournament=40)
+matches = archive_matches(details)[:num_matches]
+store = build_store(iter(matches), tempfile.mkdtemp())
+
+start = time.perf_counter()
+pointers = pointer_table(matches)
+pointer_time = time.perf_counter() - start
+
+start = time.perf_counter()
+table = win_probability_table(store)['prob']
+engine_time = time.perf_counter() - start
+
+assert np.allclose(pointers, table, equal_nan=True)
+print('%d matches' % len(store))
+print('index pointers per match: %.3f s' % pointer_time)
+print('searchsorted over store:  %.3f s' % engine_time)
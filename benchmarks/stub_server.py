@@ -0,0 +1,88 @@
+# A stand-in for the Metascouter API that runs on localhost. It speaks HTTP/1.1 so keep-alive connections are reused,
+# can add artificial latency to every response, and can answer a share of requests with 503s to exercise retries.
+# Responses carry an ETag, and a matching If-None-Match gets a 304.
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.path == '/auth/obtain-token/':
+            self.send_json(200, {'token': 'stub-token'})
+        else:
+            self.send_json(404, {'detail': 'Not found.'})
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            count = server.request_count
+        if server.latency:
+            threading.Event().wait(server.latency)
+        if server.fail_every and count % server.fail_every == 0:
+            self.send_json(503, {'detail': 'Service unavailable.'}, {'Retry-After': '0'})
+            return
+        body = server.respond(self.path)
+        if body is None:
+            self.send_json(404, {'detail': 'Not found.'})
+            return
+        etag = '"%s"' % hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_json(200, body, {'ETag': etag})
+
+
+# respond maps a request path such as /ssbu/sets/12/matches/ to the JSON body to send back, or None for a 404.
+def start_stub_server(respond, latency=0.0, fail_every=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.respond = respond
+    server.latency = latency
+    server.fail_every = fail_every
+    server.request_count = 0
+    server.not_modified_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_url(server):
+    return 'http://127.0.0.1:%d/' % server.server_address[1]
+
+
+# Points metascouter_api at a stub server (or its URL, from stub_url), with the response cache off and the token kept in
+# memory only, so a benchmark never reads or overwrites the cache or the token saved for the real API
+def use_stub(server):
+    import metascouter_api
+
+    metascouter_api.API_ROOT = server if isinstance(server, str) else stub_url(server)
+    metascouter_api.cache = None
+    metascouter_api.TOKEN_FILE = ''
+    metascouter_api.set_credentials('bench', 'bench')
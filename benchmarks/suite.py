@@ -0,0 +1,208 @@
+# A benchmark suite over synthetic archives of several sizes (see synthetic.py). For each size, a local stub server
+# serves the archive one tournament at a time, and the stages of a run are timed one after another, each in a fresh
+# process so its peak memory can be read on its own:
+#
+#     ingest      sync from the stub: fetching, validating and writing the matches, and building the columnar copy
+#     metrics     the fused metric pass over the stored matches
+#     aggregate   analysis.analyze over the columnar store
+#     render      every figure in report.py, on a single process
+#
+# JSON decoding, validation and the columnar rebuild are also reported on their own, from the ingest stage's spans
+# (see instrumentation.py).
+#
+# The results are compared with benchmarks/baseline.json, and the suite exits with an error if any stage is slower or
+# takes more memory than its baseline by more than the tolerance. Timings only compare on the machine the baseline was
+# recorded on, so rerecord it with --update-baseline when moving to another one. Run from the repository root with:
+#
+#     python -m benchmarks.suite [--scales 5000,50000] [--tolerance 0.25] [--update-baseline]
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SCALES = [5000, 50000]
+STAGES = ['ingest', 'metrics', 'aggregate', 'render']
+# Spans of the ingest stage that are reported as stages of their own
+INGEST_SPANS = {'decode': 'api.decode', 'validate': 'ingest.validate', 'build_columns': 'store.build_columns'}
+SETS_PER_TOURNAMENT = 40
+TOLERANCE = 0.25
+# Differences smaller than this are noise, however large they are relative to the baseline
+MIN_SECONDS = 0.1
+MIN_MB = 10
+
+
+# Peak resident memory of this process, or of it and the processes it has finished waiting for, in MB
+def peak_mb(children=False):
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024
+
+
+# Runs in a process of its own, so generating the archive doesn't count towards the ingest it's served to (as long as
+# there's a core to spare). Sends the server's URL down the connection and serves until anything is sent back.
+def serve_archive(num_tournaments, connection):
+    from benchmarks.stub_server import start_stub_server, stub_url
+    from benchmarks.synthetic import lazy_responder
+
+    server = start_stub_server(lazy_responder(num_tournaments, SETS_PER_TOURNAMENT))
+    connection.send(stub_url(server))
+    connection.recv()
+    server.shutdown()
+
+
+def ingest(data_dir, num_matches):
+    from benchmarks.stub_server import use_stub
+    from benchmarks.synthetic import tournament_entry, tournaments_for
+    from ingest import sync
+
+    num_tournaments = tournaments_for(num_matches, SETS_PER_TOURNAMENT)
+    connection, server_end = multiprocessing.Pipe()
+    server = multiprocessing.get_context('spawn').Process(target=serve_archive, args=(num_tournaments, server_end))
+    server.start()
+    use_stub(connection.recv())
+    tournaments = [tournament_entry(tid) for tid in range(1, num_tournaments + 1)]
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sync(tournaments, data_dir, full=True, processes=1)
+        return time.perf_counter() - start
+    finally:
+        connection.send(None)
+        server.join()
+
+
+def run_metrics(data_dir):
+    from ingest import run_metrics_sharded
+
+    return run_metrics_sharded(data_dir, processes=1)
+
+
+def aggregate(data_dir, results):
+    from analysis import analyze
+    from ingest import load_columns, load_matchups
+
+    return analyze(load_columns(data_dir), results, workers=1, matchups=load_matchups(data_dir))
+
+
+def render(data_dir, data):
+    from report import render_report
+
+    render_report(data, os.path.join(data_dir, 'report'), workers=1)
+
+
+# Runs in a fresh process. Whatever a stage needs but doesn't time (the metric results for the analysis, the analysis
+# for the figures) is prepared first, so only the stage itself counts. Returns the seconds the stage took, the peak
+# memory of the process and the number of matches, plus the ingest spans.
+def run_stage(stage, data_dir, num_matches):
+    import matplotlib
+    matplotlib.use('Agg')
+    from ingest import load_columns
+    from instrumentation import snapshot
+
+    if stage == 'aggregate':
+        results = run_metrics(data_dir)
+    elif stage == 'render':
+        data = aggregate(data_dir, run_metrics(data_dir))
+    start = time.perf_counter()
+    if stage == 'ingest':
+        # Timed from when the stub server is up
+        seconds = ingest(data_dir, num_matches)
+    else:
+        if stage == 'metrics':
+            run_metrics(data_dir)
+        elif stage == 'aggregate':
+            aggregate(data_dir, results)
+        else:
+            render(data_dir, data)
+        seconds = time.perf_counter() - start
+
+    spans = snapshot()['spans']
+    # The figures are drawn in a worker process, while the stub server ingest reads from isn't part of the stage
+    return {'seconds': seconds, 'peak_mb': peak_mb(stage == 'render'), 'matches': len(load_columns(data_dir)),
+            'spans': {name: spans[span]['seconds'] for name, span in INGEST_SPANS.items() if span in spans}}
+
+
+def run_scale(num_matches):
+    data_dir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for stage in STAGES:
+            # A spawned process starts from nothing, so its peak memory is the stage's own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(run_stage, stage, data_dir, num_matches).result()
+            results[stage] = {'seconds': result['seconds'], 'peak_mb': result['peak_mb'],
+                              'matches': result['matches']}
+            if stage == 'ingest':
+                for name, seconds in result['spans'].items():
+                    results['ingest.' + name] = {'seconds': seconds, 'matches': result['matches']}
+    finally:
+        shutil.rmtree(data_dir)
+    return results
+
+
+# Every way in which result is worse than baseline by more than the tolerance, as printable strings
+def regressions(result, baseline, tolerance):
+    found = []
+    if result['seconds'] - baseline['seconds'] > max(MIN_SECONDS, tolerance * baseline['seconds']):
+        found.append('%.2f s against %.2f s' % (result['seconds'], baseline['seconds']))
+    if 'peak_mb' in baseline and \
+            result['peak_mb'] - baseline['peak_mb'] > max(MIN_MB, tolerance * baseline['peak_mb']):
+        found.append('%.0f MB against %.0f MB' % (result['peak_mb'], baseline['peak_mb']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and measure the memory of each stage of a run over synthetic '
+                                                 'archives, and compare with the stored baseline.')
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)),
+                        help='comma separated numbers of matches, e.g. 5000,50000,1000000')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='how much slower or larger than the baseline a stage may be, as a fraction')
+    parser.add_argument('--update-baseline', action='store_true', help='record these results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    results = {}
+    failures = []
+    print('%9s %20s %9s %12s %9s %11s' % ('matches', 'stage', 'seconds', 'matches/s', 'peak MB', 'baseline'))
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        results[str(scale)] = run_scale(scale)
+        for stage, result in results[str(scale)].items():
+            expected = baseline.get(str(scale), {}).get(stage)
+            print('%9d %20s %9.2f %12.0f %9s %11s' % (result['matches'], stage, result['seconds'],
+                                                     result['matches'] / result['seconds'],
+                                                     '%.0f' % result['peak_mb'] if 'peak_mb' in result else '',
+                                                     '%.2f s' % expected['seconds'] if expected else '-'))
+            if expected and not args.update_baseline:
+                failures.extend('%d matches, %s: %s' % (scale, stage, found)
+                                for found in regressions(result, expected, args.tolerance))
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print('Baseline written to', args.baseline)
+    elif failures:
+        print('Regressions against the baseline:')
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# Synthetic Metascouter data in the shapes api_test.py consumes: tournament list entries, tournament details whose
+# sets carry nested matches, and the flat matches from sets/[ID]/matches/. Everything is generated from a seed, so a
+# given set of arguments always produces the same archive. Archives can be built in memory (make_archive) or served
+# one tournament at a time (lazy_responder), which scales to millions of matches.
+
+import functools
+import random
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import numpy as np
+
+CHARACTERS = ['peach', 'olimar', 'joker', 'inkling', 'zero_suit_samus', 'palutena', 'fox', 'pikachu',
+              'pokemon_trainer', 'mr_game_and_watch', 'wolf', 'pac_man', 'wario', 'mario', 'lucina', 'pichu', 'snake',
+              'rob', 'rosalina_and_luma', 'ike', 'mega_man']
+TOURNAMENT_NAMES = ['Genesis', 'EVO', 'Pound', 'Frostbite', 'Glitch', 'Shine', '2GG', 'Mainstage', 'The Big House',
+                    'Super Smash Con']
+
+
+# Plays out one match as a sequence of stocks. The loser loses all 3, the winner loses 0-2, and each stock lasts a
+# handful of hits. Returns the nested match and its flat counterpart.
+def make_match(rng, set_id, index_in_set, player_ids, tags, chars):
+    loser = rng.randrange(2)
+    stocks_lost = [3, 3]
+    stocks_lost[1 - loser] = rng.randint(0, 2)
+    order = [loser] * 2 + [1 - loser] * stocks_lost[1 - loser]
+    rng.shuffle(order)
+    order.append(loser)
+
+    event_data = [{'stock_data': [], 'health_data': [[0.0, 0]], 'health_at_death_data': []} for _ in range(2)]
+    stock_stats = {'1': {}, '2': {}}
+    damage = [0, 0]
+    stock_damage = [[0, 0, 0], [0, 0, 0]]
+    stock = [0, 0]
+    time = 0.0
+    for victim in order:
+        for _ in range(rng.randint(3, 10)):
+            time = round(time + rng.uniform(1, 6), 2)
+            hit = victim if rng.random() < 0.7 else 1 - victim
+            amount = rng.randint(1, 25)
+            damage[hit] += amount
+            stock_damage[1 - hit][stock[1 - hit]] += amount
+            event_data[hit]['health_data'].append([time, damage[hit]])
+        time = round(time + 1, 2)
+        event_data[victim]['stock_data'].append([time, 2 - stock[victim]])
+        event_data[victim]['health_at_death_data'].append([time, damage[victim]])
+        event_data[victim]['health_data'].append([time, 0])
+        stock_stats[str(victim + 1)][str(stock[victim] + 1)] = {'death_percent': damage[victim]}
+        damage[victim] = 0
+        stock[victim] = min(2, stock[victim] + 1)
+    for i in range(2):
+        for s in range(min(3, len(event_data[i]['stock_data']) + 1)):
+            stock_stats[str(i + 1)].setdefault(str(s + 1), {})['damage_dealt'] = stock_damage[i][s]
+
+    players = {player_ids[i]: {'id': player_ids[i], 'player': i + 1, 'player_tag': tags[i],
+                               'character': {'internal_name': chars[i]}} for i in range(2)}
+    match_id = '%d-%d' % (set_id, index_in_set)
+    nested = {'id': match_id, 'set': set_id, 'index_in_set': index_in_set, 'players': players,
+              'stats': {'ending_player_stocks': {player_ids[i]: 3 - len(event_data[i]['stock_data']) for i in range(2)},
+                        'event_data': event_data},
+              'stock_stats': stock_stats}
+    flat = {'id': match_id, 'set': set_id, 'index_in_set': index_in_set,
+            'player1': {'id': player_ids[0]}, 'player2': {'id': player_ids[1]}, 'winner': {'id': player_ids[1 - loser]},
+            'stock_events_stats': [{'player_number': 1}, {'player_number': 2}] +
+                                  [{'player_number': victim + 1} for victim in order]}
+    return nested, flat
+
+
+def player_mains(num_players, seed):
+    rng = random.Random(seed)
+    tags = ['player%d' % i for i in range(num_players)]
+    return tags, {tag: rng.sample(CHARACTERS[:12], 2) for tag in tags}
+
+
+def tournament_entry(tid):
+    return {'id': tid, 'name': TOURNAMENT_NAMES[tid % len(TOURNAMENT_NAMES)], 'number': str(tid),
+            'start_date': '%d-%02d-%02d' % (2019 + tid // 52, tid // 4 % 12 + 1, tid % 4 * 7 + 1)}
+
+
+# Builds one tournament as (list entry, detail, set ID -> list of flat matches). Each player has two mains, and sets
+# are best of 3 or 5 played out game by game. Every tournament is drawn from its own seed and owns a fixed range of set
+# IDs, so any one of them can be generated on its own, which is what lets an archive of millions of matches be
+# streamed instead of held in memory.
+def make_tournament(tid, sets_per_tournament=40, num_players=20, seed=0):
+    tags, mains = player_mains(num_players, seed)
+    rng = random.Random(seed * 1000003 + tid)
+    entry = tournament_entry(tid)
+    sets = []
+    flat_matches = {}
+    for set_id in range((tid - 1) * sets_per_tournament + 1, tid * sets_per_tournament + 1):
+        a, b = rng.sample(range(num_players), 2)
+        matches = []
+        flat_matches[set_id] = []
+        for index_in_set in range(1, rng.randint(3, 6)):
+            nested, flat = make_match(rng, set_id, index_in_set, ['p%d' % a, 'p%d' % b], [tags[a], tags[b]],
+                                      [rng.choice(mains[tags[a]]), rng.choice(mains[tags[b]])])
+            matches.append(nested)
+            flat_matches[set_id].append(flat)
+        sets.append({'id': set_id, 'matches': matches})
+    return entry, {'id': tid, 'name': entry['name'], 'sets': sets}, flat_matches
+
+
+# Sets have 3.5 matches on average, so this many tournaments make up about num_matches matches
+def tournaments_for(num_matches, sets_per_tournament=40):
+    return max(1, round(num_matches / (3.5 * sets_per_tournament)))
+
+
+# Builds (tournaments, details, flat_matches): the tournament list, tournament ID -> tournament detail, and set ID ->
+# list of flat matches, all in memory
+def make_archive(num_tournaments=10, sets_per_tournament=40, num_players=20, seed=0):
+    tournaments = []
+    details = {}
+    flat_matches = {}
+    for tid in range(1, num_tournaments + 1):
+        entry, detail, flat = make_tournament(tid, sets_per_tournament, num_players, seed)
+        tournaments.append(entry)
+        details[tid] = detail
+        flat_matches.update(flat)
+    return tournaments, details, flat_matches
+
+
+def archive_matches(details):
+    return [match for detail in details.values() for t_set in detail['sets'] for match in t_set['matches']]
+
+
+# Real health_data holds far more samples than the synthetic matches. This holds each player's damage between the
+# samples in a match's health_data, sampled every interval seconds, in place.
+def resample_health(match, interval):
+    for player_data in match['stats']['event_data']:
+        samples = player_data['health_data']
+        end = max(sample[0] for data in match['stats']['event_data'] for sample in data['health_data'])
+        times = np.round(np.arange(0, end + interval, interval), 3)
+        index = np.searchsorted([sample[0] for sample in samples], times, side='right') - 1
+        player_data['health_data'] = [[float(t), samples[i][1]] for t, i in zip(times, index)]
+
+
+# One page of a list endpoint, paginated by limit and offset query parameters like the Metascouter API. Without a limit,
+# page_size results are sent, or all of them if page_size is None.
+def list_page(path, results, page_size):
+    parts = urlsplit(path)
+    query = dict(parse_qsl(parts.query))
+    limit = int(query.get('limit', page_size or len(results) or 1))
+    offset = int(query.get('offset', 0))
+    page = {'count': len(results), 'next': None, 'previous': None, 'results': results[offset:offset + limit]}
+    if offset + limit < len(results):
+        query.update(limit=limit, offset=offset + limit)
+        page['next'] = 'http://stub' + parts.path + '?' + urlencode(query)
+    return page
+
+
+# A respond function for benchmarks.stub_server that serves an archive the way the Metascouter API would, with list
+# endpoints split into pages of page_size results if it's given. detail and flat look up a tournament's detail and a
+# set's flat matches by ID, returning None for IDs that don't exist.
+def make_responder(tournaments, detail, flat, page_size=None):
+    def respond(path):
+        if re.match(r'^/ssbu/tournaments/?(\?|$)', path):
+            return list_page(path, tournaments, page_size)
+        found = re.match(r'^/ssbu/tournaments/(\d+)', path)
+        if found:
+            return detail(int(found.group(1)))
+        found = re.match(r'^/ssbu/sets/(\d+)/matches', path)
+        if found:
+            matches = flat(int(found.group(1)))
+            return None if matches is None else list_page(path, matches, page_size)
+        return None
+    return respond
+
+
+def archive_responder(tournaments, details, flat_matches, page_size=None):
+    return make_responder(tournaments, details.get, flat_matches.get, page_size)
+
+
+# Serves an archive of num_tournaments tournaments without building it up front: each tournament is generated when its
+# details or sets are asked for, and the last few are kept, since a sync asks for a tournament's sets right after its
+# details.
+def lazy_responder(num_tournaments, sets_per_tournament=40, num_players=20, seed=0, page_size=None):
+    @functools.lru_cache(maxsize=64)
+    def tournament(tid):
+        return make_tournament(tid, sets_per_tournament, num_players, seed)
+
+    def detail(tid):
+        return tournament(tid)[1] if 1 <= tid <= num_tournaments else None
+
+    def flat(set_id):
+        tid = (set_id - 1) // sets_per_tournament + 1
+        return tournament(tid)[2][set_id] if 1 <= tid <= num_tournaments and set_id >= 1 else None
+
+    return make_responder([tournament_entry(tid) for tid in range(1, num_tournaments + 1)], detail, flat, page_size)
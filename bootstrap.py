@@ -0,0 +1,131 @@
+# Bootstrap confidence intervals, as an opt-in alternative to the 1.96 * std / sqrt(n) normal approximation. Matches
+# are resampled rather than individual values, so the several stocks a player loses in one match, or the two player
+# rows of a match, always move together. Resamples are drawn in chunks, each from its own child of one seed, so the
+# result only depends on the seed and not on how many processes the chunks were spread across.
+#
+# Everything is phrased as group means of per-row sums over per-row counts: a row (a player row, for everything in
+# analysis.py) belongs to one match and carries a sum and a count for each of K metrics. A resample gives each match a
+# weight (how many times it was drawn), and the resampled mean of a group is then sum(weight * sums) /
+# sum(weight * counts) over its rows, which is one matrix product per group. Several groupings of the same rows share
+# the resamples, so drawing the weights, which is most of the work, is only done once.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from aggregate import PLAYER_METRICS, metric_values
+from instrumentation import timed
+
+RESAMPLES = 10000
+CONFIDENCE = 0.95
+# Resamples per chunk are capped so a chunk's match weights stay around this many cells
+CHUNK_CELLS = 2000000
+MAX_CHUNK = 500
+
+# In a worker process, the (num_matches, row_matches, groupings) every chunk is resampled from
+_worker_arguments = None
+
+
+# Runs in a worker process. Each of the groupings is (row order, starts, columns), with the rows of group i at
+# order[starts[i]:starts[i + 1]] and columns holding K sums followed by K counts, already in that order. Returns the
+# resampled means for each grouping, shaped (size, number of groups, K). Weights are float32, which is plenty for a
+# percentile and halves the memory traffic.
+def resample_means(seed, size, num_matches, row_matches, groupings):
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, num_matches, size=(size, num_matches), dtype=np.int32).astype(np.int64) * size
+    weights = np.bincount((draws + np.arange(size)[:, None]).ravel(), minlength=size * num_matches)
+    weights = weights.reshape(num_matches, size).astype(np.float32)
+    results = []
+    for order, starts, columns in groupings:
+        row_weights = np.take(weights, row_matches[order], axis=0)
+        k = columns.shape[1] // 2
+        means = np.empty((size, len(starts) - 1, k))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in range(len(starts) - 1):
+                totals = row_weights[starts[i]:starts[i + 1]].T @ columns[starts[i]:starts[i + 1]]
+                means[:, i] = totals[:, :k] / totals[:, k:]
+        results.append(means)
+    return results
+
+
+# Runs once in each worker process, so the arrays are sent to it once rather than with every chunk
+def init_worker(arguments):
+    global _worker_arguments
+    _worker_arguments = arguments
+
+
+def resample_chunk(seed, size):
+    return resample_means(seed, size, *_worker_arguments)
+
+
+# The bootstrap interval of each group mean, for several groupings of the same rows. row_matches holds the match of
+# each row, and each grouping is (keys, codes, sums, counts): the group of each row, the groups to resample, and
+# (rows, K) arrays of sums and counts. Returns one (lower, upper) pair per grouping, each shaped (len(codes), K). A
+# group that happens to get no matches in a resample is left out of that resample.
+@timed('bootstrap.intervals')
+def bootstrap_intervals(row_matches, num_matches, groupings, resamples=RESAMPLES, seed=0, workers=None,
+                        confidence=CONFIDENCE):
+    prepared = []
+    for keys, codes, sums, counts in groupings:
+        keys = np.asarray(keys)
+        codes = np.asarray(codes, dtype=np.int64)
+        positions = np.full(max(keys.max(initial=0), codes.max(initial=0)) + 1, -1)
+        positions[codes] = np.arange(len(codes))
+        group = positions[keys]
+        order = np.argsort(group, kind='stable')
+        order = order[group[order] >= 0]
+        starts = np.searchsorted(group[order], np.arange(len(codes) + 1))
+        columns = np.column_stack([sums, counts])[order].astype(np.float32)
+        prepared.append((order, starts, columns))
+    arguments = (num_matches, np.asarray(row_matches), prepared)
+
+    chunk = max(1, min(MAX_CHUNK, CHUNK_CELLS // max(1, num_matches)))
+    sizes = [min(chunk, resamples - start) for start in range(0, resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(sizes) <= 1:
+        chunks = [resample_means(child, size, *arguments) for child, size in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(arguments,)) as executor:
+            chunks = list(executor.map(resample_chunk, seeds, sizes))
+    tail = (1 - confidence) / 2 * 100
+    intervals = []
+    for i in range(len(groupings)):
+        lower, upper = np.nanpercentile(np.concatenate([means[i] for means in chunks]), [tail, 100 - tail], axis=0)
+        intervals.append((lower, upper))
+    return intervals
+
+
+# Per-row sums and counts of each metric over player rows, as two (rows, K) arrays: one value per row for per-player
+# metrics, and the total and number of stocks for kill and death percents
+def metric_columns(store, metrics):
+    num_rows = len(store['players']['match'])
+    sums = np.empty((num_rows, len(metrics)))
+    counts = np.ones((num_rows, len(metrics)))
+    for k, metric in enumerate(metrics):
+        rows, values = metric_values(store, metric)
+        if metric in PLAYER_METRICS:
+            sums[:, k] = values
+        else:
+            sums[:, k] = np.bincount(rows, weights=values, minlength=num_rows)
+            counts[:, k] = np.bincount(rows, minlength=num_rows)
+    return sums, counts
+
+
+# Turns intervals around estimates into error bars: an (n, 2) array of the distances from each estimate down to the
+# lower bound and up to the upper bound
+def interval_errors(estimates, lower, upper):
+    return np.column_stack([estimates - lower, upper - estimates])
+
+
+# Error bars (below, above) for a proportion of per-match values. With one value per match, the number of successes in
+# a resample of the matches is exactly binomial, so it can be drawn directly.
+def proportion_errors(values, resamples=RESAMPLES, seed=0, confidence=CONFIDENCE):
+    values = np.asarray(values, dtype=np.float64)
+    proportion = values.mean()
+    rng = np.random.default_rng(seed)
+    resampled = rng.binomial(len(values), proportion, size=resamples) / len(values)
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.percentile(resampled, [tail, 100 - tail])
+    return np.array([proportion - lower, upper - proportion])
@@ -0,0 +1,44 @@
+# One entry point for everything that runs from the command line:
+#
+#     python cli.py sync [--tournament Genesis ...] [--full]       fetch what's new from the API (ingest.py)
+#     python cli.py aggregate character [--json]                  per-group averages of every metric (aggregate.py)
+#     python cli.py report [output directory] [--formats png]     render every chart to files (report.py)
+#     python cli.py query --player Cyan [--by opponent]           filtered lookups (query.py)
+#     python cli.py trends kill_pcts [--window month]             metrics over time, by window (trends.py)
+#     python cli.py serve [--poll 600]                            the stats service (service.py)
+#
+# Each command is the main() of its module, which is only imported once the command is known, so data-only commands
+# never load matplotlib and seaborn, and no command logs in to the API until a request can't be served from the cache.
+# python cli.py <command> --help lists a command's options.
+
+import argparse
+import importlib
+import sys
+
+# Command -> (module, description)
+COMMANDS = {
+    'sync': ('ingest', 'fetch the sets and matches that are new since the last sync'),
+    'aggregate': ('aggregate', 'mean, standard deviation and 95% margin of every metric by group'),
+    'report': ('report', 'render every chart to files, with an HTML and a Markdown index'),
+    'query': ('query', 'win rate and averages over the matches that match every filter given'),
+    'trends': ('trends', 'how a metric moves across tournaments, per tournament, rolling or calendar window'),
+    'serve': ('service', 'serve stats as JSON over HTTP and keep them up to date'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metascouter stats.', epilog='commands:\n' + '\n'.join(
+        '  %-10s %s' % (command, description) for command, (_, description) in COMMANDS.items()),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help="the command's own options")
+    args = parser.parse_args()
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    # The command parses the rest of the command line itself, and shows up in its usage as e.g. cli.py sync
+    sys.argv = [parser.prog + ' ' + args.command] + args.arguments
+    module.main()
+
+
+if __name__ == '__main__':
+    main()
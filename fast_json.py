@@ -0,0 +1,88 @@
+# Faster JSON for the large payloads: API responses, the response cache and the store files. orjson is used when it's
+# installed (pip install orjson) and the standard json module otherwise. Files written by either one read back the
+# same with the other.
+#
+# Most of a match's bytes are its health_data, stock_data and health_at_death_data time series. Decoding normally
+# turns each sample into a Python list of two numbers, about 130 bytes apiece. loads_match cuts the series out of the
+# raw bytes before the rest of the match is decoded, and parses each one straight into an (n, 2) float64 array at
+# 16 bytes a sample. It's used where matches are flattened into the columnar store (see match_store.normalize), which
+# copies the arrays into its columns whole instead of sample by sample.
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SERIES_KEYS = {b'health_data', b'stock_data', b'health_at_death_data'}
+# Every byte a JSON number or the whitespace around it can contain
+NUMBER_BYTES = b'0123456789+-.eE \t\r\n'
+
+
+def loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+# Returns bytes
+def dumps(value):
+    return orjson.dumps(value) if orjson else json.dumps(value).encode()
+
+
+# The (key, start, end) of every time series in a raw match, in order. A quote inside a JSON string is always escaped,
+# so '_data":' can only be the end of a key. Each series is a list of [time, value] pairs, which ends at the first ']]'.
+def series_spans(data):
+    spans = []
+    found = data.find(b'_data":')
+    while found >= 0:
+        key = data[data.rfind(b'"', 0, found) + 1:found + 5]
+        if key in SERIES_KEYS:
+            start = data.index(b'[', found)
+            end = start + 2 if data[start + 1:start + 2] == b']' else data.index(b']]', start) + 2
+            spans.append((key, start, end))
+            found = end
+        else:
+            found += 7
+        found = data.find(b'_data":', found)
+    return spans
+
+
+# Parses a series of [time, value] pairs into an (n, 2) float64 array, without building a list per sample. The brackets
+# are dropped before parsing, so the series is first checked to be nothing but pairs: with the numbers taken out, it
+# has to read [,],[,],... exactly. Anything else raises ValueError.
+def series_array(data):
+    shape = data[1:-1].translate(None, NUMBER_BYTES)
+    if shape != b','.join([b'[,]'] * shape.count(b'[')):
+        raise ValueError('series samples are not [time, value] pairs')
+    values = loads(b'[' + data[1:-1].translate(None, b'[]') + b']')
+    return np.array(values, dtype=np.float64).reshape(-1, 2)
+
+
+# Decodes a raw match (bytes) with its time series as NumPy arrays. Anything that doesn't look like a match with
+# event_data where it's expected, or with a series that isn't all [time, value] pairs, is decoded the ordinary way.
+def loads_match(data):
+    spans = series_spans(data)
+    pieces = []
+    position = 0
+    for i, (_, start, end) in enumerate(spans):
+        pieces.append(data[position:start])
+        pieces.append(b'%d' % i)
+        position = end
+    pieces.append(data[position:])
+    try:
+        match = loads(b''.join(pieces))
+        event_data = match['stats']['event_data']
+        placed = 0
+        for player_data in event_data:
+            for key in ('stock_data', 'health_data', 'health_at_death_data'):
+                if isinstance(player_data.get(key), int):
+                    _, start, end = spans[player_data[key]]
+                    player_data[key] = series_array(data[start:end])
+                    placed += 1
+        if placed == len(spans):
+            return match
+    except (ValueError, TypeError, KeyError, IndexError):
+        pass
+    return loads(data)
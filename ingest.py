@@ -0,0 +1,457 @@
+# Pulls sets and matches for a list of tournaments, validates them, and keeps the results on disk so that later runs
+# only have to fetch what's new. The store is a pair of append-only JSON lines files (validated matches and their
+# flat counterparts from sets/[ID]/matches/) plus a watermark recording which tournaments and sets are already in
+# them. Records that have been ingested once are never rewritten.
+#
+# The watermark also remembers where in the files each tournament's sets start, so the stored matches can be split into
+# shards by tournament and worked through by a pool of processes (see build_columns and run_metrics_sharded). The
+# partial results are merged in order, so they come out exactly as a single pass would produce them.
+#
+# Ingest is a chain of generators: tournament details stream in, each new set's flat matches are requested as soon as
+# its tournament arrives, and each set is validated and written out as soon as its matches arrive. Only the sets in
+# flight are ever held in memory, however many tournaments are being synced.
+#
+#     python ingest.py [--tournament Genesis --tournament EVO ...] [--full]
+
+import argparse
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from fast_json import dumps, loads, loads_match
+from instrumentation import collect, count, merge_snapshot, span, timed
+from match_store import load_store, merge_normalized, normalize, save_store, store_arrays, COLUMNS_DIR
+from matchups import MatchupMatrix
+from metascouter_api import api_pages, api_request_stream, api_results, set_credentials, MAX_WORKERS
+from metrics import merge_results, run_metrics
+from models import iter_models, models_from_dicts
+from query import build_index
+
+DATA_DIR = os.getenv('METASCOUTER_DATA_DIR', 'metascouter_data')
+STATE_FILE = 'ingest_state.json'
+MATCHES_FILE = 'matches.jsonl'
+MATCHES_FLAT_FILE = 'matches_flat.jsonl'
+REJECTIONS_FILE = 'rejections.jsonl'
+TOURNAMENTS_FILE = 'tournaments.json'
+MATCHUPS_FILE = 'matchups.json'
+TOURNAMENTS_URL = 'tournaments?limit=80'
+
+
+def death_at_zero(match):
+    for data in match['stats']['event_data']:
+        for death in data['health_at_death_data']:
+            if death[1] == 0:
+                return True
+    return False
+
+
+def match_tag(match):
+    return 'Match %d of set %d' % (match['index_in_set'], match['set'])
+
+
+# Why a match can be rejected, by the code that shows up in the rejection log
+REJECT_REASONS = {
+    'too_few_stock_events': 'neither player has 3 stock events',
+    'too_many_stock_events': 'player has more than 3 stock events',
+    'death_at_zero': 'death at 0 percent',
+    'no_winner': 'no winner specified',
+}
+
+
+# Returns the code for why a match can't be used, or None if it's fine
+def validate_match(match):
+    if len(match['stats']['event_data'][0]['stock_data']) < 3 and len(
+            match['stats']['event_data'][1]['stock_data']) < 3:
+        return 'too_few_stock_events'
+    elif len(match['stats']['event_data'][0]['stock_data']) > 3 or len(
+            match['stats']['event_data'][1]['stock_data']) > 3:
+        return 'too_many_stock_events'
+    elif death_at_zero(match):
+        return 'death_at_zero'
+    return None
+
+
+def validate_flat_match(match):
+    if not match['winner']:
+        return 'no_winner'
+    return None
+
+
+# Every rejected match is printed the way the script always has, appended to a JSON lines log in the data directory,
+# and counted by reason.
+class RejectionLog:
+    def __init__(self, path, mode='a'):
+        self.file = open(path, mode)
+        self.counts = Counter()
+
+    def reject(self, tournament, match, kind, reason):
+        print(match_tag(match) + ':', REJECT_REASONS[reason])
+        record = {'tournament': tournament, 'set': match['set'], 'index_in_set': match['index_in_set'],
+                  'kind': kind, 'reason': reason}
+        self.file.write(json.dumps(record) + '\n')
+        self.counts[reason] += 1
+        count('ingest.rejected.' + reason)
+
+    def close(self):
+        self.file.close()
+
+
+# A tournament whose entry in the tournament list hasn't changed since the last sync is assumed to have no new sets
+def fingerprint(tournament):
+    return hashlib.sha1(json.dumps(tournament, sort_keys=True).encode()).hexdigest()
+
+
+# The watermark also records how far each store file had been written when it was saved. Anything past that point
+# was left behind by an interrupted sync, so it is ignored on load and truncated before the next append. runs holds
+# [tournament ID, matches offset, flat matches offset] wherever a run of one tournament's sets starts.
+def new_state():
+    return {'tournaments': {}, 'sets': {}, 'offsets': {MATCHES_FILE: 0, MATCHES_FLAT_FILE: 0}, 'runs': []}
+
+
+def load_state(data_dir=DATA_DIR):
+    path = os.path.join(data_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return new_state()
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(state, data_dir=DATA_DIR):
+    path = os.path.join(data_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
+
+
+# The tournament list entries of every synced tournament, by ID, so tournaments can be looked up by name later
+def load_tournaments(data_dir=DATA_DIR):
+    path = os.path.join(data_dir, TOURNAMENTS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return {int(tid): tournament for tid, tournament in json.load(file).items()}
+
+
+def save_tournaments(tournaments, data_dir=DATA_DIR):
+    path = os.path.join(data_dir, TOURNAMENTS_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(tournaments, file)
+    os.replace(path + '.tmp', path)
+
+
+def stored_size(data_dir, name):
+    path = os.path.join(data_dir, name)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+# Reads the records in a store file up to the committed offset, one line at a time
+def read_records(data_dir, name, offset):
+    path = os.path.join(data_dir, name)
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as file:
+        position = 0
+        for line in file:
+            position += len(line)
+            if position > offset:
+                return
+            yield loads(line)
+
+
+def iter_matches(data_dir=DATA_DIR, state=None):
+    state = state or load_state(data_dir)
+    return read_records(data_dir, MATCHES_FILE, state['offsets'][MATCHES_FILE])
+
+
+def iter_matches_flat(data_dir=DATA_DIR, state=None):
+    state = state or load_state(data_dir)
+    return read_records(data_dir, MATCHES_FLAT_FILE, state['offsets'][MATCHES_FLAT_FILE])
+
+
+# Reads the records between two offsets of a store file, which must both be at the start of a line, decoding each one
+# with decode
+def read_range(data_dir, name, start, end, decode=loads):
+    with open(os.path.join(data_dir, name), 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            line = file.readline()
+            position += len(line)
+            yield decode(line)
+
+
+# Splits the stored matches into at most num_shards shards of whole tournament runs, each a contiguous stretch of both
+# store files given as {file name: (start, end)}, with roughly the same number of bytes of matches in each. Stores
+# written before runs were recorded are one run.
+def shard_ranges(state, num_shards):
+    offsets = state['offsets']
+    runs = [run[1:] for run in state.get('runs', [])]
+    if not runs or runs[0] != [0, 0]:
+        runs.insert(0, [0, 0])
+    runs.append([offsets[MATCHES_FILE], offsets[MATCHES_FLAT_FILE]])
+    target = offsets[MATCHES_FILE] / max(1, num_shards)
+    bounds = [runs[0]]
+    for run in runs[1:-1]:
+        if run[0] - bounds[-1][0] >= target:
+            bounds.append(run)
+    bounds.append(runs[-1])
+    return [{MATCHES_FILE: (start[0], end[0]), MATCHES_FLAT_FILE: (start[1], end[1])}
+            for start, end in zip(bounds, bounds[1:]) if end[0] > start[0] or end[1] > start[1]]
+
+
+# Run in worker processes, one shard each
+@timed('store.normalize_shard')
+def normalize_shard(data_dir, shard, set_tournaments):
+    return normalize(read_range(data_dir, MATCHES_FILE, *shard[MATCHES_FILE], loads_match), set_tournaments)
+
+
+# The stored matches for a metric pass come from the columnar store as models.Match objects, from the store rows given
+# as shard['rows'] if the store is up to date, or else normalized from the matches file there and then
+def metrics_shard(data_dir, shard, names):
+    if 'rows' in shard:
+        matches = iter_models(load_columns(data_dir), *shard['rows'])
+    else:
+        matches = models_from_dicts(read_range(data_dir, MATCHES_FILE, *shard[MATCHES_FILE], loads_match))
+    return run_metrics({'matches': matches,
+                        'matches_flat': read_range(data_dir, MATCHES_FLAT_FILE, *shard[MATCHES_FLAT_FILE])}, names)
+
+
+def num_processes(processes):
+    return processes or os.cpu_count() or 1
+
+
+# Runs function(data_dir, shard, *arguments) for every shard, on a pool of processes unless there's only one, and
+# returns the results in shard order. What the workers time and count is added to this process's run report.
+def map_shards(function, data_dir, shards, processes, *arguments):
+    if num_processes(processes) <= 1 or len(shards) <= 1:
+        return [function(data_dir, shard, *arguments) for shard in shards]
+    with ProcessPoolExecutor(max_workers=num_processes(processes)) as executor:
+        futures = [executor.submit(collect, function, data_dir, shard, *arguments) for shard in shards]
+        results = []
+        for future in futures:
+            result, numbers = future.result()
+            merge_snapshot(numbers)
+            results.append(result)
+        return results
+
+
+# Brings the columnar copy of the stored matches (see match_store.py) and its query index up to date. The store records
+# how far into the matches file it goes, and if it's still within the file only the matches after that are normalized
+# and appended; merging keeps the result exactly what a rebuild would give. Otherwise (or with incremental=False) it's
+# rebuilt, normalizing the shards in parallel.
+@timed('store.build_columns')
+def build_columns(data_dir=DATA_DIR, state=None, processes=None, incremental=True):
+    state = state or load_state(data_dir)
+    set_tournaments = {int(set_id): tid for set_id, tid in state['sets'].items()}
+    directory = os.path.join(data_dir, COLUMNS_DIR)
+    end = state['offsets'][MATCHES_FILE]
+    covered = load_store(directory).offset if incremental and os.path.isdir(directory) else None
+    if covered is not None and covered <= end:
+        new = normalize(read_range(data_dir, MATCHES_FILE, covered, end, loads_match), set_tournaments)
+        arrays, vocab = merge_normalized([store_arrays(load_store(directory)), new])
+    else:
+        parts = map_shards(normalize_shard, data_dir, shard_ranges(state, num_processes(processes)), processes,
+                           set_tournaments)
+        arrays, vocab = merge_normalized(parts) if parts else normalize([])
+    save_store(arrays, vocab, directory, end)
+    store = load_store(directory)
+    build_index(store)
+    return store
+
+
+# run_metrics over all stored matches, with the shards folded in parallel and merged (see metrics.py). When the columnar
+# store covers all of the matches, the metrics read them from it instead of decoding the matches file. The stored and
+# flat matches are separate sources that no metric reads both of, so each shard's stretch of store rows doesn't have to
+# line up with its stretch of the flat matches file, only follow the previous shard's.
+@timed('metrics.run_metrics_sharded')
+def run_metrics_sharded(data_dir=DATA_DIR, processes=None, names=None, state=None):
+    state = state or load_state(data_dir)
+    shards = shard_ranges(state, num_processes(processes))
+    if shards and store_is_current(data_dir, state):
+        num_matches = len(load_columns(data_dir))
+        for i, shard in enumerate(shards):
+            shard['rows'] = (i * num_matches // len(shards), (i + 1) * num_matches // len(shards))
+    partials = map_shards(metrics_shard, data_dir, shards, processes, names)
+    return merge_results(partials) if partials else run_metrics({'matches': [], 'matches_flat': []}, names)
+
+
+def load_columns(data_dir=DATA_DIR):
+    return load_store(os.path.join(data_dir, COLUMNS_DIR))
+
+
+# The store, for commands that only read synced data. With nothing synced yet, that's said instead of failing on the
+# missing files.
+def load_synced_columns(data_dir=DATA_DIR):
+    if not os.path.isdir(os.path.join(data_dir, COLUMNS_DIR)):
+        raise SystemExit('Nothing synced yet, run `python cli.py sync` first.')
+    return load_columns(data_dir)
+
+
+# Whether the columnar store covers exactly the committed matches. One that doesn't is missing, was left behind by a
+# sync interrupted while rebuilding it, or predates stores recording their offset, and has to be brought up to date.
+def store_is_current(data_dir=DATA_DIR, state=None):
+    state = state or load_state(data_dir)
+    directory = os.path.join(data_dir, COLUMNS_DIR)
+    return os.path.isdir(directory) and load_store(directory).offset == state['offsets'][MATCHES_FILE]
+
+
+# The matchup matrix is updated match by match during a sync and saved with the matches file offset it covers. If that
+# isn't the committed offset (the sync saving it was interrupted, or it predates the file), it's rebuilt from the
+# stored matches.
+def load_matchups(data_dir=DATA_DIR, state=None):
+    state = state or load_state(data_dir)
+    path = os.path.join(data_dir, MATCHUPS_FILE)
+    if os.path.exists(path):
+        matchups, offset = MatchupMatrix.load(path)
+        if offset == state['offsets'][MATCHES_FILE]:
+            return matchups
+    matchups = MatchupMatrix()
+    for match in iter_matches(data_dir, state):
+        matchups.add_match(match)
+    return matchups
+
+
+# Yields (tournament ID, set) for every set not yet in the store, as tournament details come in. Tournaments whose
+# details can't be fetched are added to failed. These tournaments are new or their list entry changed, so a cached
+# detail may be missing the sets that changed it, and is revalidated however fresh it is.
+def stream_new_sets(tournaments, state, workers, failed):
+    keyed_urls = ((tournament['id'], 'tournaments/' + str(tournament['id'])) for tournament in tournaments)
+    for tid, detail in api_request_stream(keyed_urls, workers, revalidate=True):
+        if detail is None:
+            failed.add(tid)
+            continue
+        for t_set in detail['sets']:
+            if str(t_set['id']) not in state['sets']:
+                yield tid, t_set
+
+
+# Yields (tournament ID, set, flat matches) as each set's flat matches come in. The first pages of many sets are fetched
+# concurrently, and a set with more than one page has the rest of them read before it's passed on.
+def stream_set_matches(sets, workers, failed):
+    keyed_urls = (((tid, t_set), 'sets/' + str(t_set['id']) + '/matches/') for tid, t_set in sets)
+    for (tid, t_set), first in api_request_stream(keyed_urls, workers):
+        pages = list(api_pages(None, first)) if first is not None else [None]
+        if None in pages:
+            failed.add(tid)
+            continue
+        yield tid, t_set, [match for page in pages for match in page['results']]
+
+
+# Yields (tournament ID, set ID, valid matches, valid flat matches), sending everything else to the rejection log
+def validate_sets(sets, rejections):
+    for tid, t_set, flat_matches in sets:
+        with span('ingest.validate'):
+            valid = []
+            for match in t_set['matches']:
+                reason = validate_match(match)
+                if reason:
+                    rejections.reject(tid, match, 'match', reason)
+                else:
+                    valid.append(match)
+            valid_flat = []
+            for match in flat_matches:
+                reason = validate_flat_match(match)
+                if reason:
+                    rejections.reject(tid, match, 'flat_match', reason)
+                else:
+                    valid_flat.append(match)
+        yield tid, t_set['id'], valid, valid_flat
+
+
+# Brings the store up to date with the given tournaments. Only tournaments that are new or whose list entry changed
+# get their details fetched, and only sets that haven't been ingested before get their matches fetched. With
+# full=True the store is thrown away and rebuilt from scratch. The new matches are appended to the columnar copy of
+# the matches (see match_store.py) whenever anything new came in, while the matchup matrix (see matchups.py) is just
+# updated with each new match as it's written. Returns the rejection counts by reason.
+@timed('ingest.sync')
+def sync(tournaments, data_dir=DATA_DIR, workers=MAX_WORKERS, full=False, processes=None):
+    os.makedirs(data_dir, exist_ok=True)
+    state = load_state(data_dir) if not full else new_state()
+    # A store file shorter than the watermark has lost matches that were synced, so the store is rebuilt from scratch
+    if any(stored_size(data_dir, name) < offset for name, offset in state['offsets'].items()):
+        print('The stored matches are shorter than the last sync left them, so everything is fetched again.')
+        full = True
+        state = new_state()
+    # The watermark is reset before the files are emptied, so an interrupted full sync doesn't leave it pointing past
+    # their ends
+    if full:
+        save_state(state, data_dir)
+    matchups = load_matchups(data_dir, state) if not full else MatchupMatrix()
+
+    changed = [t for t in tournaments if state['tournaments'].get(str(t['id'])) != fingerprint(t)]
+    print(len(tournaments) - len(changed), 'tournaments unchanged since the last sync,', len(changed), 'to update')
+
+    failed = set()
+    rejections = RejectionLog(os.path.join(data_dir, REJECTIONS_FILE), 'w' if full else 'a')
+    sets = validate_sets(stream_set_matches(stream_new_sets(changed, state, workers, failed), workers, failed),
+                         rejections)
+    num_sets = 0
+    num_matches = 0
+    offsets = state['offsets']
+    with open(os.path.join(data_dir, MATCHES_FILE), 'ab') as matches_file, \
+            open(os.path.join(data_dir, MATCHES_FLAT_FILE), 'ab') as flat_file:
+        # Truncating leaves the reported position where it was, so move it to the new end before anything uses tell()
+        for file, name in [(matches_file, MATCHES_FILE), (flat_file, MATCHES_FLAT_FILE)]:
+            file.truncate(offsets[name])
+            file.seek(0, os.SEEK_END)
+        runs = state.setdefault('runs', [])
+        for tid, set_id, valid, valid_flat in sets:
+            if not runs or runs[-1][0] != tid:
+                runs.append([tid, matches_file.tell(), flat_file.tell()])
+            for match in valid:
+                matches_file.write(dumps(match) + b'\n')
+                matchups.add_match(match)
+            for match in valid_flat:
+                flat_file.write(dumps(match) + b'\n')
+            state['sets'][str(set_id)] = tid
+            num_sets += 1
+            num_matches += len(valid)
+        offsets[MATCHES_FILE] = matches_file.tell()
+        offsets[MATCHES_FLAT_FILE] = flat_file.tell()
+    count('ingest.sets', num_sets)
+    count('ingest.matches', num_matches)
+    rejections.close()
+
+    # A tournament with a set that couldn't be fetched keeps its old fingerprint, so it's looked at again next time
+    for tournament in changed:
+        if tournament['id'] not in failed:
+            state['tournaments'][str(tournament['id'])] = fingerprint(tournament)
+    save_state(state, data_dir)
+    matchups.save(os.path.join(data_dir, MATCHUPS_FILE), offsets[MATCHES_FILE])
+    known = load_tournaments(data_dir) if not full else {}
+    known.update((tournament['id'], tournament) for tournament in tournaments)
+    save_tournaments(known, data_dir)
+    print(num_matches, 'new matches ingested from', num_sets, 'sets')
+    for reason, rejected in rejections.counts.items():
+        print(rejected, 'rejected:', REJECT_REASONS[reason])
+
+    if num_matches or full or not store_is_current(data_dir, state):
+        build_columns(data_dir, state, processes, incremental=not full)
+    return rejections.counts
+
+
+# Every tournament in the API's list, or only those with one of the given names
+def list_tournaments(names=None):
+    with span('api.tournament_list'):
+        return [tournament for tournament in api_results(TOURNAMENTS_URL) if not names or tournament['name'] in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch the sets and matches that are new since the last sync.')
+    parser.add_argument('--tournament', action='append',
+                        help='only sync tournaments with this name (repeatable, default: every tournament)')
+    parser.add_argument('--full', action='store_true', help='throw away the synced matches and fetch everything again')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='API requests in flight at once')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='processes for rebuilding the columnar store (default: one per core)')
+    args = parser.parse_args()
+
+    # The API needs a JWT token, which is retrieved the first time a request can't be served from the response cache
+    set_credentials(os.getenv('METASCOUTER_USER', 'Cyan'), os.getenv('METASCOUTER_PWD'))
+    sync(list_tournaments(set(args.tournament or ())), workers=args.workers, full=args.full, processes=args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Timing spans and counters for a run, so a slow run can be pinned on the API, JSON decoding, validation, the
+# aggregation sweeps or matplotlib, and written out as a JSON run report that can be compared between runs:
+#
+#     with span('ingest.validate'):
+#         ...
+#     count('api.bytes', len(request.content))
+#
+# Spans with the same name are added up into a count, a total and the longest single span, so timing every request
+# only costs a couple of dict updates. Spans can be nested and opened from several threads at once, in which case
+# their totals add up to more than the wall time. Work done in a worker process is collected there (see collect) and
+# merged into the parent's numbers.
+#
+# Set METASCOUTER_RUN_REPORT to a path to have api_test.py write the report there, and METASCOUTER_PROFILE to also
+# run cProfile over the main thread, with its slowest functions in the report and the raw profile next to it.
+
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_FUNCTIONS = 30
+
+spans = {}
+counters = Counter()
+started = time.time()
+_start = time.perf_counter()
+_lock = threading.Lock()
+_profiler = None
+
+
+def add_span(name, seconds):
+    with _lock:
+        stats = spans.get(name)
+        if stats is None:
+            spans[name] = {'count': 1, 'seconds': seconds, 'max_seconds': seconds}
+        else:
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+@contextlib.contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, time.perf_counter() - start)
+
+
+# Decorator form of span, for timing every call of a function
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, amount=1):
+    with _lock:
+        counters[name] += amount
+
+
+def snapshot():
+    with _lock:
+        return {'spans': {name: dict(stats) for name, stats in spans.items()}, 'counters': dict(counters)}
+
+
+# Adds the spans and counters of a snapshot, e.g. one taken in a worker process, to this process's
+def merge_snapshot(other):
+    for name, stats in other['spans'].items():
+        with _lock:
+            mine = spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            mine['count'] += stats['count']
+            mine['seconds'] += stats['seconds']
+            mine['max_seconds'] = max(mine['max_seconds'], stats['max_seconds'])
+    for name, amount in other['counters'].items():
+        count(name, amount)
+
+
+# Runs function(*arguments) and returns (its result, the spans and counters it recorded), leaving this process's own
+# numbers as they were. Submit this to a process pool in place of the function itself and pass the second half of
+# the result to merge_snapshot in the parent.
+def collect(function, *arguments):
+    global spans, counters
+    with _lock:
+        saved = spans, counters
+        spans, counters = {}, Counter()
+    try:
+        result = function(*arguments)
+        return result, snapshot()
+    finally:
+        with _lock:
+            spans, counters = saved
+
+
+def start_profile():
+    global _profiler
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+
+# The slowest functions by cumulative time in the profile, as a list of dicts
+def profile_stats(profiler, limit=PROFILE_FUNCTIONS):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': function, 'file': filename, 'line': line, 'calls': calls,
+                     'own_seconds': own, 'cumulative_seconds': cumulative})
+    rows.sort(key=lambda row: -row['cumulative_seconds'])
+    return rows[:limit]
+
+
+# Writes the run report as JSON. If a profile is running it's stopped, and the raw profile is saved next to the report
+# with a .prof extension, for snakeviz or pstats.
+def write_report(path, extra=None):
+    global _profiler
+    report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+              'wall_seconds': time.perf_counter() - _start, 'argv': sys.argv}
+    report.update(snapshot())
+    report['spans'] = dict(sorted(report['spans'].items(), key=lambda item: -item[1]['seconds']))
+    report['counters'] = dict(sorted(report['counters'].items()))
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(os.path.splitext(path)[0] + '.prof')
+        report['profile'] = profile_stats(_profiler)
+        _profiler = None
+    report.update(extra or {})
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
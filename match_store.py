@@ -0,0 +1,266 @@
+# A columnar copy of the validated matches. Instead of walking match['stats']['event_data'][i]['health_at_death_data']
+# and friends for every analysis, matches are flattened once into a handful of tables of NumPy arrays:
+#
+#   matches       one row per match
+#   players       one row per player per match (row 2 * match + slot, where slot 0 is player 1)
+#   stocks        one row per entry in match['stock_stats']
+#   deaths        one row per entry in health_at_death_data
+#   stock_events  one row per entry in stock_data
+#   health        one row per entry in health_data
+#
+# The last three are time series. Their rows are grouped by player row, and each table has an 'offsets' column of
+# length 2 * num_matches + 1, so the samples for player row r are rows offsets[r]:offsets[r + 1]. Player tags and
+# character names are stored as integer codes into the vocabularies in vocab.json.
+#
+# Each column is saved as its own .npy file, so loading memory-maps only the columns an analysis actually touches.
+# A store can also record how far into the matches file it goes (see ingest.build_columns), so that later matches can
+# be appended to it without normalizing the earlier ones again.
+
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+COLUMNS_DIR = 'columns'
+OFFSET_FILE = 'offset.json'
+
+SCHEMA = {
+    'matches': {'set': np.int64, 'index_in_set': np.int16, 'tournament': np.int64, 'winner': np.int8,
+                'stocks_remaining': np.int8},
+    'players': {'match': np.int32, 'slot': np.int8, 'player': np.int32, 'character': np.int32, 'won': np.bool_,
+                'kills': np.int8, 'deaths': np.int8, 'damage_dealt': np.float64, 'damage_taken': np.float64},
+    'stocks': {'match': np.int32, 'slot': np.int8, 'stock': np.int8, 'damage_dealt': np.float64,
+               'death_percent': np.float64},
+    'deaths': {'match': np.int32, 'slot': np.int8, 'time': np.float64, 'percent': np.float64},
+    'stock_events': {'match': np.int32, 'slot': np.int8, 'time': np.float64},
+    'health': {'match': np.int32, 'slot': np.int8, 'time': np.float64, 'damage': np.float64},
+}
+# Time series tables, with the event_data key each one comes from and the column for the second value of a sample
+SERIES = {'deaths': ('health_at_death_data', 'percent'), 'stock_events': ('stock_data', None),
+          'health': ('health_data', 'damage')}
+
+
+class Table:
+    def __init__(self, directory, name, mmap=True):
+        self.directory = os.path.join(directory, name)
+        self.name = name
+        self.mmap = mmap
+        self.columns = {}
+
+    def __getitem__(self, column):
+        if column not in self.columns:
+            self.columns[column] = np.load(os.path.join(self.directory, column + '.npy'),
+                                           mmap_mode='r' if self.mmap else None)
+        return self.columns[column]
+
+    def __len__(self):
+        return len(self[next(iter(SCHEMA[self.name]))])
+
+
+class MatchStore:
+    def __init__(self, directory, mmap=True):
+        self.directory = directory
+        with open(os.path.join(directory, 'vocab.json')) as file:
+            vocab = json.load(file)
+        self.player_names = vocab['player']
+        self.character_names = vocab['character']
+        self.player_codes = {tag: code for code, tag in enumerate(self.player_names)}
+        self.character_codes = {char: code for code, char in enumerate(self.character_names)}
+        self.tables = {name: Table(directory, name, mmap) for name in SCHEMA}
+        self.offset = None
+        if os.path.exists(os.path.join(directory, OFFSET_FILE)):
+            with open(os.path.join(directory, OFFSET_FILE)) as file:
+                self.offset = json.load(file)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __len__(self):
+        return len(self.tables['matches'])
+
+    # Loads every column now instead of on first use. A mapped file stays readable after it's deleted or replaced, so a
+    # store opened this way keeps reading the matches it was opened on while a sync rewrites the directory.
+    def open_all(self):
+        for table in self.tables.values():
+            for name in os.listdir(table.directory):
+                if name.endswith('.npy'):
+                    table[name[:-len('.npy')]]
+        return self
+
+    def player_code(self, tag):
+        return self.player_codes[tag]
+
+    def character_code(self, char):
+        return self.character_codes[char]
+
+
+# Columns are collected in typed array.array buffers rather than lists, which keeps them at their final size (8 bytes
+# per float instead of a pointer plus a float object) while matches are streamed through
+TYPECODES = {np.bool_: 'b', np.int8: 'b', np.int16: 'h', np.int32: 'i', np.int64: 'q', np.float64: 'd'}
+
+
+def column_buffer(dtype):
+    return array(TYPECODES[dtype])
+
+
+# Flattens validated matches into columns. matches can be any iterable, such as a generator reading them from disk, and
+# only one match is looked at at a time. set_tournaments maps set ID to tournament ID (the ingest watermark keeps
+# exactly this); matches from unknown sets get a tournament of -1.
+def normalize(matches, set_tournaments=None):
+    set_tournaments = set_tournaments or {}
+    vocab = {'player': {}, 'character': {}}
+    tables = {name: {column: column_buffer(dtype) for column, dtype in columns.items()}
+              for name, columns in SCHEMA.items()}
+    offsets = {name: array('q', [0]) for name in SERIES}
+
+    def code(kind, value):
+        if value not in vocab[kind]:
+            vocab[kind][value] = len(vocab[kind])
+        return vocab[kind][value]
+
+    for m, match in enumerate(matches):
+        slots = [None, None]
+        for player_data in match['players'].values():
+            slots[0 if player_data['player'] == 1 else 1] = player_data
+
+        kills = [0, 0]
+        deaths = [0, 0]
+        damage_dealt = [0, 0]
+        damage_taken = [0, 0]
+        stocks = tables['stocks']
+        for i in range(2):
+            for stock_num, stock in match['stock_stats'][str(i + 1)].items():
+                damage_dealt[i] += stock['damage_dealt']
+                damage_taken[1 - i] += stock['damage_dealt']
+                stocks['match'].append(m)
+                stocks['slot'].append(i)
+                stocks['stock'].append(int(stock_num))
+                stocks['damage_dealt'].append(stock['damage_dealt'])
+                if 'death_percent' in stock:
+                    stocks['death_percent'].append(stock['death_percent'])
+                    deaths[i] += 1
+                    kills[1 - i] += 1
+                else:
+                    stocks['death_percent'].append(np.nan)
+
+        ending_stocks = match['stats']['ending_player_stocks']
+        players = tables['players']
+        winner = -1
+        for i in range(2):
+            won = ending_stocks[slots[i]['id']] > 0
+            if won:
+                winner = i
+            players['match'].append(m)
+            players['slot'].append(i)
+            players['player'].append(code('player', slots[i]['player_tag']))
+            players['character'].append(code('character', slots[i]['character']['internal_name']))
+            players['won'].append(won)
+            players['kills'].append(kills[i])
+            players['deaths'].append(deaths[i])
+            players['damage_dealt'].append(damage_dealt[i])
+            players['damage_taken'].append(damage_taken[i])
+
+            event_data = match['stats']['event_data'][i]
+            for name, (key, value_column) in SERIES.items():
+                series = tables[name]
+                samples = event_data[key]
+                if isinstance(samples, np.ndarray):
+                    # Decoded by fast_json.loads_match, so the columns can be copied in whole
+                    series['match'].extend(array('i', [m]) * len(samples))
+                    series['slot'].extend(array('b', [i]) * len(samples))
+                    series['time'].frombytes(samples[:, 0].tobytes())
+                    if value_column:
+                        series[value_column].frombytes(samples[:, 1].tobytes())
+                else:
+                    for sample in samples:
+                        series['match'].append(m)
+                        series['slot'].append(i)
+                        series['time'].append(sample[0])
+                        if value_column:
+                            series[value_column].append(sample[1])
+                offsets[name].append(len(series['match']))
+
+        rows = tables['matches']
+        rows['set'].append(match['set'])
+        rows['index_in_set'].append(match['index_in_set'])
+        rows['tournament'].append(set_tournaments.get(match['set'], -1))
+        rows['winner'].append(winner)
+        rows['stocks_remaining'].append(sum(ending_stocks.values()))
+
+    arrays = {name: {column: np.frombuffer(values, dtype=values.typecode).astype(SCHEMA[name][column])
+                     for column, values in columns.items()}
+              for name, columns in tables.items()}
+    for name in SERIES:
+        arrays[name]['offsets'] = np.frombuffer(offsets[name], dtype=np.int64).copy()
+    return arrays, {kind: list(codes) for kind, codes in vocab.items()}
+
+
+# Combines the normalize() output of consecutive shards of the matches into what normalize() would have returned for all
+# of them. Codes are handed out in the order values first appear, shard by shard, which is the order a single pass
+# would have seen them in, so the result is identical.
+def merge_normalized(parts):
+    vocab = {'player': {}, 'character': {}}
+    pieces = {name: {column: [] for column in columns} for name, columns in SCHEMA.items()}
+    offsets = {name: [] for name in SERIES}
+    num_rows = {name: 0 for name in SERIES}
+    num_matches = 0
+    for arrays, part_vocab in parts:
+        remap = {kind: np.array([vocab[kind].setdefault(value, len(vocab[kind])) for value in part_vocab[kind]],
+                                dtype=np.int64) for kind in vocab}
+        for name, columns in SCHEMA.items():
+            for column in columns:
+                values = arrays[name][column]
+                if column == 'match':
+                    values = values + num_matches
+                elif name == 'players' and column in remap:
+                    values = remap[column][values]
+                pieces[name][column].append(values)
+        for name in SERIES:
+            offsets[name].append(arrays[name]['offsets'][:-1] + num_rows[name])
+            num_rows[name] += len(arrays[name]['match'])
+        num_matches += len(arrays['matches']['set'])
+
+    merged = {name: {column: np.concatenate(values).astype(SCHEMA[name][column]) if values else
+                     np.zeros(0, dtype=SCHEMA[name][column]) for column, values in columns.items()}
+              for name, columns in pieces.items()}
+    for name in SERIES:
+        merged[name]['offsets'] = np.concatenate(offsets[name] + [[num_rows[name]]]).astype(np.int64)
+    return merged, {kind: list(codes) for kind, codes in vocab.items()}
+
+
+# The store is written next to the final location and swapped in once complete, so a reader never sees half of it.
+# offset, if given, is saved with it for the caller to record how much of the matches it covers.
+def save_store(arrays, vocab, directory, offset=None):
+    temp_directory = directory.rstrip('/') + '.tmp'
+    shutil.rmtree(temp_directory, ignore_errors=True)
+    for name, columns in arrays.items():
+        os.makedirs(os.path.join(temp_directory, name))
+        for column, values in columns.items():
+            np.save(os.path.join(temp_directory, name, column + '.npy'), values)
+    with open(os.path.join(temp_directory, 'vocab.json'), 'w') as file:
+        json.dump(vocab, file)
+    if offset is not None:
+        with open(os.path.join(temp_directory, OFFSET_FILE), 'w') as file:
+            json.dump(offset, file)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(temp_directory, directory)
+
+
+def build_store(matches, directory, set_tournaments=None):
+    arrays, vocab = normalize(matches, set_tournaments)
+    save_store(arrays, vocab, directory)
+    return MatchStore(directory)
+
+
+def load_store(directory, mmap=True):
+    return MatchStore(directory, mmap)
+
+
+# A saved store read back into memory in the form normalize() returns, e.g. to merge more matches into it
+def store_arrays(store):
+    arrays = {name: {column: np.array(store[name][column]) for column in SCHEMA[name]} for name in SCHEMA}
+    for name in SERIES:
+        arrays[name]['offsets'] = np.array(store[name]['offsets'])
+    return arrays, {'player': list(store.player_names), 'character': list(store.character_names)}
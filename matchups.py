@@ -0,0 +1,96 @@
+# Character matchup results as an integer matrix indexed by character ID: wins[i, j] is how many matches character i
+# won against character j, so the number of i vs. j matches is wins[i, j] + wins[j, i]. Even a full roster of 80+
+# characters is only a few thousand cells, so a dense int64 array is both the compact and the fast choice.
+#
+# Recording a match is a single increment. New characters get the next ID, and the array grows by doubling, so adding
+# stays O(1) amortized. A matrix keeps its own character names, which means partial matrices built over different
+# stores or by different workers can be merged by name.
+
+import json
+import os
+
+import numpy as np
+
+
+class MatchupMatrix:
+    def __init__(self, names=(), wins=None):
+        self.names = list(names)
+        self.codes = {name: code for code, name in enumerate(self.names)}
+        size = max(4, len(self.names))
+        self.capacity = np.zeros((size, size), dtype=np.int64)
+        if wins is not None:
+            self.capacity[:len(wins), :len(wins)] = wins
+
+    @property
+    def wins(self):
+        return self.capacity[:len(self.names), :len(self.names)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+            if len(self.names) > len(self.capacity):
+                capacity = np.zeros((2 * len(self.capacity), 2 * len(self.capacity)), dtype=np.int64)
+                capacity[:len(self.capacity), :len(self.capacity)] = self.capacity
+                self.capacity = capacity
+        return self.codes[name]
+
+    def add(self, winner, loser):
+        winner, loser = self.code(winner), self.code(loser)
+        self.capacity[winner, loser] += 1
+
+    # Player 1 loses a match when they lose all 3 stocks, the same rule analysis.py has always used
+    def add_match(self, match):
+        slots = [None, None]
+        for player_data in match['players'].values():
+            slots[0 if player_data['player'] == 1 else 1] = player_data['character']['internal_name']
+        deaths1 = sum('death_percent' in stock for stock in match['stock_stats']['1'].values())
+        self.add(*(slots[::-1] if deaths1 == 3 else slots))
+
+    # Adds many matches at once, given the winning and losing characters' IDs in this matrix
+    def add_codes(self, winners, losers):
+        size = len(self.names)
+        self.capacity[:size, :size] += np.bincount(np.asarray(winners, dtype=np.int64) * size + losers,
+                                                   minlength=size * size).reshape(size, size)
+
+    def merge(self, other):
+        codes = np.array([self.code(name) for name in other.names], dtype=np.int64)
+        self.capacity[np.ix_(codes, codes)] += other.wins
+        return self
+
+    # Wins and match counts between the given characters, in that order
+    def table(self, names):
+        codes = [self.codes[name] for name in names]
+        wins = self.wins[np.ix_(codes, codes)]
+        return wins, wins + wins.T
+
+    # Every character, most played first
+    def characters(self):
+        counts = self.wins.sum(axis=0) + self.wins.sum(axis=1)
+        return [self.names[code] for code in np.argsort(-counts, kind='stable')]
+
+    @classmethod
+    def from_store(cls, store):
+        matrix = cls(store.character_names)
+        players = store['players']
+        characters = np.asarray(players['character']).reshape(-1, 2)
+        player1_lost = np.asarray(players['deaths']).reshape(-1, 2)[:, 0] == 3
+        matrix.add_codes(np.where(player1_lost, characters[:, 1], characters[:, 0]),
+                         np.where(player1_lost, characters[:, 0], characters[:, 1]))
+        return matrix
+
+    # offset is saved along with the matrix, for the caller to record how much of the data it covers
+    def save(self, path, offset=None):
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'names': self.names, 'wins': self.wins.tolist(), 'offset': offset}, file)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            saved = json.load(file)
+        size = len(saved['names'])
+        return cls(saved['names'], np.array(saved['wins'], dtype=np.int64).reshape(size, size)), saved['offset']
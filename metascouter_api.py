@@ -0,0 +1,297 @@
+# Shared access to the Metascouter API. Every request goes through a pooled keep-alive session, transient failures
+# (429 and 5xx) are retried with exponential backoff, and batches of endpoints can be fetched concurrently while the
+# results still come back in the order they were asked for. Responses are kept in an on-disk cache (see
+# response_cache.py), so a warm rerun is served without touching the network at all.
+#
+# List endpoints such as tournaments and sets/[ID]/matches/ are paginated: each page holds some of the results and a
+# link to the next page. api_pages and api_results follow those links to the end instead of stopping at the first page.
+#
+# Requests are timed by kind of endpoint (see instrumentation.py) and counted along with the bytes downloaded, retries
+# and how each one was served: from the cache, revalidated with a 304, or downloaded.
+#
+# requests is only imported once a request has to go out over the network, and the JWT token is saved to TOKEN_FILE and
+# reused until it expires, so commands that only read synced data or cached responses start quickly and never log in.
+
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from fast_json import loads
+from instrumentation import count, span
+from response_cache import ResponseCache, MAX_BYTES
+
+# Point METASCOUTER_API_URL at a local stub server to run everything without touching the real API.
+API_ROOT = os.getenv('METASCOUTER_API_URL', 'https://api.metascouter.gg/').rstrip('/') + '/'
+GAME = 'ssbu'
+
+MAX_WORKERS = 8
+MAX_RETRIES = 4
+BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Seconds to wait for a connection and then for each read, so a stalled connection is retried instead of holding up
+# its worker (and a sync) forever
+TIMEOUT = (10, 60)
+
+# Set METASCOUTER_CACHE_DIR to an empty string to turn the cache off. In offline mode only cached responses are used,
+# however old they are, and anything missing from the cache is reported as an error.
+CACHE_DIR = os.getenv('METASCOUTER_CACHE_DIR', '.metascouter_cache')
+CACHE_MAX_BYTES = int(os.getenv('METASCOUTER_CACHE_MB', MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+offline = os.getenv('METASCOUTER_OFFLINE', '') not in ('', '0')
+cache = ResponseCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
+
+# Set METASCOUTER_TOKEN_FILE to an empty string to log in afresh on every run instead. Tokens without an expiry in
+# their payload are assumed to last TOKEN_LIFETIME seconds, and none is reused within TOKEN_MARGIN seconds of expiring.
+TOKEN_FILE = os.getenv('METASCOUTER_TOKEN_FILE', os.path.join(os.path.expanduser('~'), '.metascouter_token.json'))
+TOKEN_LIFETIME = 300
+TOKEN_MARGIN = 30
+
+username = None
+password = None
+token = None
+_token_lock = threading.Lock()
+_local = threading.local()
+
+
+# requests.Session is not guaranteed to be thread safe, so each worker thread keeps its own session. Each one still
+# holds its connections open between calls, which is where the savings over a bare requests.get come from.
+def get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+# Authentication is deferred until the first request that actually has to go out over the network, so runs that are
+# served entirely from the cache don't need the password or a connection.
+def set_credentials(user, pwd):
+    global username, password, token
+    username, password, token = user, pwd, None
+
+
+# When a JWT token expires, from the exp claim in its payload, or None if it can't be read
+def token_expiry(jwt):
+    try:
+        payload = jwt.split('.')[1]
+        return float(loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp'])
+    except (IndexError, ValueError, TypeError, KeyError):
+        return None
+
+
+# The token saved by an earlier run for the same user and API, if it's still good
+def load_token():
+    if not TOKEN_FILE or not os.path.exists(TOKEN_FILE):
+        return None
+    try:
+        with open(TOKEN_FILE) as file:
+            saved = json.load(file)
+        if saved['username'] == username and saved['api_root'] == API_ROOT and \
+                saved['expires'] - TOKEN_MARGIN > time.time():
+            return saved['token']
+    except (OSError, ValueError, TypeError, KeyError):
+        pass
+    return None
+
+
+# Readable by the owner only, since the token stands in for the password until it expires
+def save_token(jwt):
+    if not TOKEN_FILE:
+        return
+    expires = token_expiry(jwt) or time.time() + TOKEN_LIFETIME
+    try:
+        descriptor = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # The mode only applies to a file os.open creates, so one that was already there is narrowed here
+        os.fchmod(descriptor, 0o600)
+        with open(descriptor, 'w') as file:
+            json.dump({'username': username, 'api_root': API_ROOT, 'token': jwt, 'expires': expires}, file)
+    except OSError as error:
+        print('Could not save the API token:', error)
+
+
+def authenticate():
+    global token
+    with span('api.token'):
+        request = send('POST', API_ROOT + 'auth/obtain-token/', json={'username': username, 'password': password})
+    if request is None or request.status_code != 200:
+        return None
+    token = request.json()['token']
+    save_token(token)
+    return token
+
+
+def get_token():
+    global token
+    with _token_lock:
+        if token is None:
+            token = load_token()
+        if token is None and authenticate() is None:
+            raise SystemExit('ERROR RETRIEVING JWT TOKEN')
+    return token
+
+
+# Drops a token the API turned down, here and on disk, unless another thread has already replaced it
+def discard_token(rejected):
+    global token
+    with _token_lock:
+        if token == rejected:
+            token = None
+            if TOKEN_FILE and os.path.exists(TOKEN_FILE):
+                os.remove(TOKEN_FILE)
+
+
+def retry_delay(request, attempt):
+    retry_after = request.headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF * 2 ** attempt
+
+
+# Sends a request, retrying connections that fail or time out and 429 and 5xx responses with exponential backoff.
+# Returns the response, or None if the request never got through.
+def send(method, url, **kwargs):
+    import requests
+
+    session = get_session()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            request = session.request(method, url, timeout=TIMEOUT, **kwargs)
+        except requests.RequestException as error:
+            if attempt == MAX_RETRIES:
+                print('There was an error with the api_request.')
+                print(error)
+                count('api.errors')
+                return None
+            count('api.retries')
+            time.sleep(BACKOFF * 2 ** attempt)
+            continue
+        if request.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            count('api.retries')
+            time.sleep(retry_delay(request, attempt))
+            continue
+        return request
+
+
+def fetch(url, headers):
+    return send('GET', API_ROOT + GAME + '/' + url, headers=headers)
+
+
+# The kind of endpoint a url is, for timing requests: 'tournaments', 'tournaments/[ID]' or 'sets/[ID]/matches'
+def endpoint_kind(url):
+    return re.sub(r'\d+', '[ID]', url.split('?')[0].strip('/'))
+
+
+# A cached response is used without a request while it's fresh. With revalidate, it's checked with the server
+# whatever its age (an unchanged one still only costs a 304), for when the caller knows it may be out of date.
+def api_request(url, revalidate=False):
+    entry = cache.get(url) if cache else None
+    if entry and (offline or (not revalidate and cache.is_fresh(url, entry))):
+        count('cache.hits')
+        return entry['body']
+    if offline:
+        count('api.errors')
+        print('There was an error with the api_request.')
+        print('Offline and not cached:', url)
+        return None
+
+    headers = {}
+    if entry and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry['last_modified']:
+        headers['If-Modified-Since'] = entry['last_modified']
+    # A saved token can be revoked before it expires, in which case it's replaced and the request tried once more
+    for attempt in range(2):
+        jwt = get_token()
+        headers['Authorization'] = 'JWT ' + jwt
+        with span('api.request.' + endpoint_kind(url)):
+            request = fetch(url, headers)
+        if request is None:
+            return None
+        if request.status_code != 401 or attempt:
+            break
+        count('api.token_rejected')
+        discard_token(jwt)
+    count('api.requests')
+    count('api.bytes', len(request.content))
+    if request.status_code == 304 and entry:
+        count('cache.not_modified')
+        return cache.refresh(url, entry)['body']
+    if request.status_code != 200:
+        print('There was an error with the api_request.')
+        print(request)
+        count('api.errors')
+        return None
+    count('api.downloaded')
+    with span('api.decode'):
+        body = loads(request.content)
+    if cache:
+        cache.put(url, body, request.headers.get('ETag'), request.headers.get('Last-Modified'))
+    return body
+
+
+# Fetches every url with at most max_workers requests in flight. The results line up with urls, and an endpoint that
+# fails after all of its retries shows up as None just like it would from api_request.
+def api_request_many(urls, max_workers=MAX_WORKERS):
+    urls = list(urls)
+    if max_workers <= 1 or len(urls) <= 1:
+        return [api_request(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(api_request, urls))
+
+
+# Like api_request_many, but takes (key, url) pairs from any iterable, including a lazy one, and yields (key, result)
+# pairs in the same order. Only a couple of requests per worker are queued ahead of the consumer, so a long stream of
+# responses never piles up in memory. revalidate is passed on to api_request.
+def api_request_stream(keyed_urls, max_workers=MAX_WORKERS, revalidate=False):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for key, url in keyed_urls:
+            pending.append((key, executor.submit(api_request, url, revalidate)))
+            if len(pending) >= max_workers * 2:
+                done_key, future = pending.popleft()
+                yield done_key, future.result()
+        while pending:
+            done_key, future = pending.popleft()
+            yield done_key, future.result()
+
+
+# The endpoint a next or previous link points to, e.g. 'tournaments?limit=80&offset=80'. Links are absolute URLs, but
+# only the part after the game is kept, so the request still goes to API_ROOT and through the cache like any other.
+def link_endpoint(link):
+    parts = urlsplit(link)
+    path = parts.path.split('/' + GAME + '/', 1)[-1]
+    return path + ('?' + parts.query if parts.query else '')
+
+
+# Yields every page of a paginated endpoint, following the next links. The next page is requested as soon as its link
+# is known, so it's on its way while the caller works through the current one. A caller that already has the first
+# page can pass it in. A page that can't be fetched is yielded as None and ends the stream.
+def api_pages(url, first=None):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = first if first is not None else api_request(url)
+        while page is not None and page.get('next'):
+            upcoming = executor.submit(api_request, link_endpoint(page['next']))
+            yield page
+            page = upcoming.result()
+        yield page
+
+
+# The results of every page of a paginated endpoint, as a lazy stream. If a page can't be fetched, the stream stops
+# there.
+def api_results(url):
+    for page in api_pages(url):
+        if page is None:
+            print('Stopped reading', url, 'at a page that could not be fetched.')
+            return
+        yield from page['results']
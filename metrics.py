@@ -0,0 +1,141 @@
+# A registry of per-match metrics that are all computed in one pass. Each metric names the source it reads (the
+# stored 'matches', as models.Match objects, or the flat 'matches_flat' dicts), the per-match fields it needs, a
+# starting value, and a fold function that takes the running value and one match's fields and returns the new running
+# value. run_metrics walks each source once, extracts each needed field once per match, and feeds every registered
+# metric, so adding a metric adds a fold call rather than another scan over the data.
+#
+# Each metric also says how to merge two partial values, folded over consecutive shards of the matches, into the value
+# a single fold over both shards would have given. That lets the matches be split across processes (see
+# ingest.run_metrics_sharded) with exactly the same results.
+#
+# To add a metric, register a fold function:
+#
+#     @register_metric('name', 'matches', ['stocks_remaining'], lambda: 0, lambda a, b: a + b)
+#     def name(total, stocks_remaining):
+#         return total + ...
+
+from collections import Counter
+
+from instrumentation import span
+
+
+def first_blood_won(match):
+    first_blood = 3 - match['stock_events_stats'][2]['player_number']
+    return match['player' + str(first_blood)]['id'] == match['winner']['id']
+
+
+# How to pull each field out of a match, by source
+FIELDS = {
+    'matches': {
+        'players': lambda match: [(slot.tag, slot.character) for slot in match.players],
+        'stocks_remaining': lambda match: match.stocks_remaining,
+        'stock_times': lambda match: [slot.stock_times for slot in match.players],
+        'death_percents': lambda match: [slot.health_at_death.values for slot in match.players],
+    },
+    'matches_flat': {
+        'first_blood_won': first_blood_won,
+    },
+}
+
+METRICS = {}
+
+
+def register_metric(name, source, fields, initial, merge):
+    def register(fold):
+        METRICS[name] = {'source': source, 'fields': fields, 'initial': initial, 'fold': fold, 'merge': merge}
+        return fold
+    return register
+
+
+# sources maps a source name to an iterable of its matches, e.g. {'matches': iter_matches()}. Sources that no requested
+# metric reads are never iterated. Returns {metric name: folded value}.
+def run_metrics(sources, names=None):
+    names = names or list(METRICS)
+    results = {}
+    for source, matches in sources.items():
+        metrics = [(name, METRICS[name]) for name in names if METRICS[name]['source'] == source]
+        if not metrics:
+            continue
+        needed = {field for _, metric in metrics for field in metric['fields']}
+        extractors = [(field, FIELDS[source][field]) for field in needed]
+        values = {name: metric['initial']() for name, metric in metrics}
+        with span('metrics.' + source):
+            for match in matches:
+                fields = {field: extract(match) for field, extract in extractors}
+                for name, metric in metrics:
+                    values[name] = metric['fold'](values[name], *[fields[field] for field in metric['fields']])
+        results.update(values)
+    return results
+
+
+# Merges run_metrics results from consecutive shards of the matches, in order
+def merge_results(partials):
+    results = dict(partials[0])
+    for partial in partials[1:]:
+        for name in results:
+            results[name] = METRICS[name]['merge'](results[name], partial[name])
+    return results
+
+
+def add_lists(a, b):
+    return [x + y for x, y in zip(a, b)]
+
+
+# Counter.update adds counts and keeps keys in the order they were first seen, just like a single pass
+def merge_frequencies(freqs, other):
+    freqs['character_freq'].update(other['character_freq'])
+    for char, players in other['character_reps'].items():
+        freqs['character_reps'].setdefault(char, set()).update(players)
+    freqs['player_freq'].update(other['player_freq'])
+    for player, chars in other['player_char_freq'].items():
+        freqs['player_char_freq'].setdefault(player, Counter()).update(chars)
+    return freqs
+
+
+# How many times each player, character, and player-character combination shows up determines whether we can make
+# inferences about its damage stats
+@register_metric('frequencies', 'matches', ['players'],
+                 lambda: {'character_freq': Counter(), 'character_reps': {}, 'player_freq': Counter(),
+                          'player_char_freq': {}}, merge_frequencies)
+def frequencies(freqs, players):
+    for player, char in players:
+        freqs['character_freq'][char] += 1
+        freqs['character_reps'].setdefault(char, set()).add(player)
+        freqs['player_freq'][player] += 1
+        freqs['player_char_freq'].setdefault(player, Counter())[char] += 1
+    return freqs
+
+
+# Number of matches ending with each total of remaining stocks, i.e. the winner's margin
+@register_metric('stock_diffs', 'matches', ['stocks_remaining'], lambda: [0, 0, 0, 0], add_lists)
+def stock_diffs(counts, stocks_remaining):
+    counts[stocks_remaining] += 1
+    return counts
+
+
+# Final score of matches where one player went down 2 stocks to 0
+@register_metric('stock_diff', 'matches', ['stock_times'], lambda: {'0-3': 0, '0-2': 0, '0-1': 0, '1-0': 0},
+                 lambda a, b: {key: a[key] + b[key] for key in a})
+def stock_diff(counts, stock_times):
+    p1_stocks, p2_stocks = stock_times
+    if len(p2_stocks) == 0 or len(p1_stocks) > 1 and p1_stocks[1] < p2_stocks[0]:
+        counts[str(3 - len(p1_stocks)) + '-' + str(3 - len(p2_stocks))] += 1
+    elif len(p1_stocks) == 0 or len(p2_stocks) > 1 and p2_stocks[1] < p1_stocks[0]:
+        counts[str(3 - len(p2_stocks)) + '-' + str(3 - len(p1_stocks))] += 1
+    return counts
+
+
+# [losses, wins] by how many of a player's deaths came at or below 100%
+@register_metric('outcomes', 'matches', ['death_percents'], lambda: [[0, 0], [0, 0], [0, 0], [0, 0]],
+                 lambda a, b: [add_lists(x, y) for x, y in zip(a, b)])
+def outcomes(counts, death_percents):
+    for percents in death_percents:
+        num_early_deaths = sum([percent <= 100 for percent in percents])
+        counts[num_early_deaths][0 if len(percents) == 3 else 1] += 1
+    return counts
+
+
+@register_metric('first_stock_wins', 'matches_flat', ['first_blood_won'], list, lambda a, b: a + b)
+def first_stock_wins(wins, first_blood_won):
+    wins.append(first_blood_won)
+    return wins
@@ -0,0 +1,184 @@
+# Typed, match-at-a-time views of the columnar store (see match_store.py), for code that folds over matches one by one,
+# like the fused metric pass, instead of over whole columns. A Match holds its two PlayerSlots, and each slot its Stocks
+# and its time series, all as __slots__ objects rather than the nested dicts the API sends:
+#
+#     match.players[0].tag, match.players[0].character      instead of match['players'][id]['player_tag'], ...
+#     match.players[1].stocks[0].death_percent              instead of match['stock_stats']['2']['1']['death_percent']
+#     match.players[0].health_at_death.values               instead of [death[1] for death in match['stats'][...]]
+#
+# The store is built once at ingest, and these are views of it: a Match or PlayerSlot is only a reference to a stretch
+# of columns and a row number, and reads its fields from the columns when they're asked for, so making one costs about
+# as much as a tuple and nothing is copied per match. Player tags and character names are the store's vocabulary,
+# interned, so every slot shares the same few hundred strings.
+
+import math
+import sys
+
+import numpy as np
+
+from match_store import normalize, SCHEMA, SERIES
+
+
+class HealthSeries:
+    __slots__ = ('times', 'values')
+
+    def __init__(self, times, values):
+        self.times = times
+        self.values = values
+
+    def __len__(self):
+        return len(self.times)
+
+
+class Stock:
+    __slots__ = ('number', 'damage_dealt', 'death_percent')
+
+    # death_percent is None for a stock that wasn't lost
+    def __init__(self, number, damage_dealt, death_percent):
+        self.number = number
+        self.damage_dealt = damage_dealt
+        self.death_percent = death_percent
+
+
+# A stretch of store rows, column by column (struct of arrays), which Matches and PlayerSlots read from. Per-match and
+# per-player numbers and the short series (at most one sample per stock) are Python lists, from one tolist() per column,
+# while health_data, with a sample every few frames, stays in NumPy.
+class Rows:
+    __slots__ = ('matches', 'players', 'tags', 'characters', 'stock_bounds', 'stocks', 'series')
+
+    def __init__(self, arrays, player_names, character_names, start, end):
+        self.matches = {column: arrays['matches'][column][start:end].tolist() for column in SCHEMA['matches']}
+        self.players = {column: arrays['players'][column][2 * start:2 * end].tolist() for column in SCHEMA['players']}
+        self.tags = [sys.intern(tag) for tag in player_names]
+        self.characters = [sys.intern(char) for char in character_names]
+        # Stocks are stored in player row order, so each player row's stocks are one stretch of the table
+        first, last = np.searchsorted(arrays['stocks']['match'], [start, end])
+        stock_rows = 2 * np.asarray(arrays['stocks']['match'][first:last], dtype=np.int64) + \
+            arrays['stocks']['slot'][first:last]
+        self.stock_bounds = np.searchsorted(stock_rows, np.arange(2 * start, 2 * end + 1)).tolist()
+        self.stocks = [arrays['stocks'][column][first:last].tolist()
+                       for column in ('stock', 'damage_dealt', 'death_percent')]
+        self.series = {}
+        for name, (_, value_column) in SERIES.items():
+            table = arrays[name]
+            offsets = np.asarray(table['offsets'][2 * start:2 * end + 1])
+            columns = [table['time']] + ([table[value_column]] if value_column else [])
+            if name == 'health':
+                self.series[name] = (offsets.tolist(), *[np.asarray(column) for column in columns])
+            else:
+                self.series[name] = ((offsets - offsets[0]).tolist(),
+                                     *[np.asarray(column[offsets[0]:offsets[-1]]).tolist() for column in columns])
+
+
+class PlayerSlot:
+    __slots__ = ('rows', 'row')
+
+    def __init__(self, rows, row):
+        self.rows = rows
+        self.row = row
+
+    @property
+    def tag(self):
+        return self.rows.tags[self.rows.players['player'][self.row]]
+
+    @property
+    def character(self):
+        return self.rows.characters[self.rows.players['character'][self.row]]
+
+    @property
+    def won(self):
+        return self.rows.players['won'][self.row]
+
+    @property
+    def kills(self):
+        return self.rows.players['kills'][self.row]
+
+    @property
+    def deaths(self):
+        return self.rows.players['deaths'][self.row]
+
+    @property
+    def damage_dealt(self):
+        return self.rows.players['damage_dealt'][self.row]
+
+    @property
+    def damage_taken(self):
+        return self.rows.players['damage_taken'][self.row]
+
+    @property
+    def stocks(self):
+        first, last = self.rows.stock_bounds[self.row], self.rows.stock_bounds[self.row + 1]
+        return [Stock(number, damage_dealt, None if math.isnan(death_percent) else death_percent)
+                for number, damage_dealt, death_percent in zip(*[values[first:last] for values in self.rows.stocks])]
+
+    # The times in stock_data
+    @property
+    def stock_times(self):
+        offsets, times = self.rows.series['stock_events']
+        return times[offsets[self.row]:offsets[self.row + 1]]
+
+    # health_at_death_data, as (time, percent)
+    @property
+    def health_at_death(self):
+        offsets, times, percents = self.rows.series['deaths']
+        first, last = offsets[self.row], offsets[self.row + 1]
+        return HealthSeries(times[first:last], percents[first:last])
+
+    # health_data, as (time, damage)
+    @property
+    def health(self):
+        offsets, times, damage = self.rows.series['health']
+        first, last = offsets[self.row], offsets[self.row + 1]
+        return HealthSeries(times[first:last], damage[first:last])
+
+
+class Match:
+    __slots__ = ('rows', 'index')
+
+    def __init__(self, rows, index):
+        self.rows = rows
+        self.index = index
+
+    @property
+    def set(self):
+        return self.rows.matches['set'][self.index]
+
+    @property
+    def index_in_set(self):
+        return self.rows.matches['index_in_set'][self.index]
+
+    @property
+    def tournament(self):
+        return self.rows.matches['tournament'][self.index]
+
+    # The slot (0 or 1) of the player who won, or -1
+    @property
+    def winner(self):
+        return self.rows.matches['winner'][self.index]
+
+    @property
+    def stocks_remaining(self):
+        return self.rows.matches['stocks_remaining'][self.index]
+
+    # Both PlayerSlots, in slot order
+    @property
+    def players(self):
+        return PlayerSlot(self.rows, 2 * self.index), PlayerSlot(self.rows, 2 * self.index + 1)
+
+
+# Yields a Match for each of rows start to end of a store, or of normalize() output given as (arrays, vocab)
+def iter_models(store, start=0, end=None):
+    if isinstance(store, tuple):
+        arrays, vocab = store
+        player_names, character_names = vocab['player'], vocab['character']
+    else:
+        arrays, player_names, character_names = store, store.player_names, store.character_names
+    end = len(arrays['matches']['set']) if end is None else end
+    rows = Rows(arrays, player_names, character_names, start, end)
+    for index in range(end - start):
+        yield Match(rows, index)
+
+
+# Matches as decoded from the API or the matches file, as Match objects, e.g. for running metrics over them directly
+def models_from_dicts(matches, set_tournaments=None):
+    return iter_models(normalize(matches, set_tournaments))
@@ -0,0 +1,282 @@
+# Filtered lookups over the columnar match store, e.g. how one player's Joker does against Palutena at Genesis, without
+# scanning every match. Next to the store's tables sits an index holding, for each player, character, character pair
+# (character and opponent character), tournament and set, the sorted list of rows that have it. These are kept the
+# same way as the store's time series: one array of rows sorted by key and an offsets array, so the rows for key k are
+# rows[offsets[k]:offsets[k + 1]]. Tournament and set IDs aren't small integers, so their keys are looked up in a
+# sorted array of IDs first. A query picks the rows for each filter and intersects them.
+#
+# The index is built by ingest.sync whenever the store is rebuilt, and otherwise on first use.
+#
+#     python query.py --player Cyan --character joker --opponent-character palutena --tournament Genesis [--by set]
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+INDEX_DIR = 'index'
+# Columns a query result can be broken down by
+BREAKDOWNS = ['player', 'character', 'opponent', 'opponent_character', 'tournament', 'set']
+
+
+# Sorts values by key and returns (order, offsets), where order[offsets[k]:offsets[k + 1]] are the positions with key
+# k, in increasing order
+def postings(keys, num_keys):
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_keys), out=offsets[1:])
+    return order, offsets
+
+
+def id_postings(ids):
+    values, keys = np.unique(ids, return_inverse=True)
+    order, offsets = postings(keys.ravel(), len(values))
+    return values, order, offsets
+
+
+def build_index(store):
+    players = store['players']
+    matches = store['matches']
+    num_characters = len(store.character_names)
+    characters = np.asarray(players['character'], dtype=np.int64)
+    index = {}
+    index['player_rows'], index['player_offsets'] = postings(np.asarray(players['player']), len(store.player_names))
+    index['character_rows'], index['character_offsets'] = postings(characters, num_characters)
+    pairs = characters * num_characters + characters.reshape(-1, 2)[:, ::-1].ravel()
+    index['pair_rows'], index['pair_offsets'] = postings(pairs, num_characters * num_characters)
+    index['tournament_ids'], index['tournament_matches'], index['tournament_offsets'] = \
+        id_postings(np.asarray(matches['tournament']))
+    index['set_ids'], index['set_matches'], index['set_offsets'] = id_postings(np.asarray(matches['set']))
+
+    directory = os.path.join(store.directory, INDEX_DIR)
+    os.makedirs(directory + '.tmp', exist_ok=True)
+    for name, values in index.items():
+        np.save(os.path.join(directory + '.tmp', name + '.npy'), values)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    os.replace(directory + '.tmp', directory)
+    return MatchIndex(store)
+
+
+def load_index(store):
+    if not os.path.isdir(os.path.join(store.directory, INDEX_DIR)):
+        return build_index(store)
+    return MatchIndex(store)
+
+
+class MatchIndex:
+    def __init__(self, store):
+        self.store = store
+        self.directory = os.path.join(store.directory, INDEX_DIR)
+        self.arrays = {}
+
+    def __getitem__(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+        return self.arrays[name]
+
+    # Maps every index array now, like MatchStore.open_all
+    def open_all(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                self[name[:-len('.npy')]]
+        return self
+
+    def size(self, name, key):
+        offsets = self[name + '_offsets']
+        return int(offsets[key + 1] - offsets[key])
+
+    def lookup(self, name, key):
+        offsets = self[name + '_offsets']
+        return np.asarray(self[name + '_rows'][offsets[key]:offsets[key + 1]])
+
+    # Positions of the given tournament or set IDs among the indexed ones, leaving out IDs that aren't there
+    def id_positions(self, name, ids):
+        values = self[name + '_ids']
+        positions = np.searchsorted(values, ids)
+        return [position for position, value in zip(positions, ids) if position < len(values) and
+                values[position] == value]
+
+    # Both player rows of every match at the given positions of the tournament or set IDs
+    def lookup_ids(self, name, positions):
+        offsets = self[name + '_offsets']
+        matches = np.concatenate([self[name + '_matches'][offsets[p]:offsets[p + 1]] for p in positions] or
+                                 [np.zeros(0, dtype=np.int64)]).astype(np.int64)
+        return np.sort(np.concatenate([2 * matches, 2 * matches + 1]))
+
+    # Each given filter as (number of rows, function returning its rows, function telling which of some rows pass),
+    # or None if the filter can't match anything (an unknown name, say)
+    def plan(self, player, character, opponent, opponent_character, tournaments, sets):
+        store = self.store
+        players = store['players']
+        matches = store['matches']
+        steps = []
+        for tag, opposing in [(player, 0), (opponent, 1)]:
+            if tag is not None:
+                code = store.player_codes.get(tag)
+                if code is None:
+                    return None
+                steps.append((self.size('player', code), lambda code=code, opposing=opposing:
+                              np.sort(self.lookup('player', code) ^ opposing),
+                              lambda rows, code=code, opposing=opposing: players['player'][rows ^ opposing] == code))
+        chars = [store.character_codes.get(char, -1) if char is not None else None
+                 for char in (character, opponent_character)]
+        if -1 in chars:
+            return None
+        if None not in chars:
+            pair = chars[0] * len(store.character_names) + chars[1]
+            steps.append((self.size('pair', pair), lambda: self.lookup('pair', pair),
+                          lambda rows: (players['character'][rows] == chars[0]) &
+                                       (players['character'][rows ^ 1] == chars[1])))
+        else:
+            for code, opposing in zip(chars, (0, 1)):
+                if code is not None:
+                    steps.append((self.size('character', code), lambda code=code, opposing=opposing:
+                                  np.sort(self.lookup('character', code) ^ opposing),
+                                  lambda rows, code=code, opposing=opposing:
+                                  players['character'][rows ^ opposing] == code))
+        for name, ids in [('tournament', tournaments), ('set', sets)]:
+            if ids is not None:
+                positions = self.id_positions(name, ids)
+                offsets = self[name + '_offsets']
+                size = 2 * sum(int(offsets[p + 1] - offsets[p]) for p in positions)
+                steps.append((size, lambda name=name, positions=positions: self.lookup_ids(name, positions),
+                              lambda rows, name=name, ids=ids: np.isin(matches[name][rows // 2], ids)))
+        return steps
+
+    # The player rows matching every filter that is given, seen from the filtered player's side. player, opponent and
+    # the characters are names; tournaments and sets are lists of IDs. Like a database with one index per column, the
+    # rows come from the filter with the fewest, and the other filters are checked against just those rows.
+    def rows(self, player=None, character=None, opponent=None, opponent_character=None, tournaments=None, sets=None):
+        steps = self.plan(player, character, opponent, opponent_character, tournaments, sets)
+        if steps is None:
+            return np.zeros(0, dtype=np.int64)
+        if not steps:
+            return np.arange(2 * len(self.store))
+        steps.sort(key=lambda step: step[0])
+        rows = steps[0][1]()
+        for _, _, keep in steps[1:]:
+            rows = rows[keep(rows)]
+        return rows
+
+
+# Win rate and per-match averages over the given player rows, from the players' side
+def summarize(store, rows):
+    players = store['players']
+    deaths = store['deaths']
+    summary = {'matches': len(rows), 'sets': len(np.unique(store['matches']['set'][rows // 2]))}
+    if not len(rows):
+        return summary
+    summary['wins'] = int(np.count_nonzero(players['won'][rows]))
+    summary['win_rate'] = summary['wins'] / len(rows)
+    for column in ['kills', 'deaths', 'damage_dealt', 'damage_taken']:
+        summary[column] = float(np.mean(players[column][rows]))
+    # Death percents are the time series rows of the player; kill percents are those of the opponent
+    offsets = np.asarray(deaths['offsets'])
+    for name, owners in [('kill_pct', rows ^ 1), ('death_pct', rows)]:
+        starts, ends = offsets[owners], offsets[owners + 1]
+        lengths = ends - starts
+        samples = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        summary[name] = float(np.mean(deaths['percent'][samples])) if len(samples) else None
+    return summary
+
+
+# The key of each player row for a breakdown, and a function turning a key into a label
+def breakdown_keys(store, rows, by, tournament_names=None):
+    players = store['players']
+    if by in ('player', 'opponent'):
+        keys = players['player'][rows if by == 'player' else rows ^ 1]
+        return keys, lambda key: store.player_names[key]
+    if by in ('character', 'opponent_character'):
+        keys = players['character'][rows if by == 'character' else rows ^ 1]
+        return keys, lambda key: store.character_names[key]
+    keys = store['matches'][by][rows // 2]
+    names = tournament_names or {}
+    return keys, lambda key: names.get(int(key), str(key)) if by == 'tournament' else str(key)
+
+
+# Runs a query and returns its summary, or {label: summary} broken down by one of BREAKDOWNS
+def query(store, index=None, by=None, tournament_names=None, **filters):
+    index = index or load_index(store)
+    rows = index.rows(**filters)
+    if by is None:
+        return summarize(store, rows)
+    keys, label = breakdown_keys(store, rows, by, tournament_names)
+    order = np.argsort(keys, kind='stable')
+    values, starts = np.unique(keys[order], return_index=True)
+    groups = np.split(rows[order], starts[1:])
+    results = {label(value): summarize(store, np.sort(group)) for value, group in zip(values, groups)}
+    return dict(sorted(results.items(), key=lambda item: -item[1]['matches']))
+
+
+# Tournament IDs whose name, or name and number (e.g. 'Genesis 7'), matches, ignoring case
+def tournament_ids(tournaments, name):
+    name = name.lower()
+    return [tid for tid, tournament in tournaments.items()
+            if name in (tournament['name'].lower(), (tournament['name'] + ' ' + str(tournament['number'])).lower())]
+
+
+# The IDs of the tournaments given as IDs, names or names and numbers
+def resolve_tournaments(tournaments, values):
+    ids = []
+    for value in values:
+        ids.extend([int(value)] if value.isdigit() else tournament_ids(tournaments, value))
+    return ids
+
+
+def tournament_labels(tournaments):
+    return {tid: tournament['name'] + ' ' + str(tournament['number']) for tid, tournament in tournaments.items()}
+
+
+def format_summary(summary):
+    if not summary['matches']:
+        return '0 matches'
+    return ('%d matches in %d sets, %d wins (%.1f%%), %.2f stocks taken, %.2f stocks lost, %.1f damage dealt, '
+            '%.1f damage taken, %s kill %%, %s death %%' %
+            (summary['matches'], summary['sets'], summary['wins'], 100 * summary['win_rate'], summary['kills'],
+             summary['deaths'], summary['damage_dealt'], summary['damage_taken'],
+             '-' if summary['kill_pct'] is None else '%.1f' % summary['kill_pct'],
+             '-' if summary['death_pct'] is None else '%.1f' % summary['death_pct']))
+
+
+def main():
+    from ingest import load_synced_columns, load_tournaments
+
+    parser = argparse.ArgumentParser(description='Win rate and averages over the synced matches that match every '
+                                                 'filter given.')
+    parser.add_argument('--player', help='player tag')
+    parser.add_argument('--character', help="the player's character, e.g. joker")
+    parser.add_argument('--opponent', help="the opponent's player tag")
+    parser.add_argument('--opponent-character', help="the opponent's character")
+    parser.add_argument('--tournament', action='append', help='tournament ID, name or name and number (repeatable)')
+    parser.add_argument('--set', type=int, action='append', help='set ID (repeatable)')
+    parser.add_argument('--by', choices=BREAKDOWNS, help='break the results down by this column')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    store = load_synced_columns()
+    tournaments = load_tournaments()
+    ids = None
+    if args.tournament:
+        ids = resolve_tournaments(tournaments, args.tournament)
+        if not ids:
+            print('No synced tournament matches', ', '.join(args.tournament))
+    results = query(store, by=args.by, tournament_names=tournament_labels(tournaments), player=args.player,
+                    character=args.character, opponent=args.opponent, opponent_character=args.opponent_character,
+                    tournaments=ids, sets=args.set)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif args.by is None:
+        print(format_summary(results))
+    elif not results:
+        print('0 matches')
+    else:
+        for label, summary in results.items():
+            print('%s: %s' % (label, format_summary(summary)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+# Every chart in the analysis, drawn from the dict that analysis.analyze() returns. api_test.py draws them one at a
+# time and shows each in a window. Run as a script, this renders them all to files instead, with no prompts and a
+# non-GUI backend, spreading the figures across a process pool, and writes an index.html and index.md linking them.
+#
+#     python report.py [output directory] [--formats png,svg] [--workers N] [--bootstrap RESAMPLES] [--seed N]
+#                      [--run-report run.json [--profile]]
+#
+# The report is built from whatever has already been synced into the data directory (see ingest.py).
+
+import argparse
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+
+from instrumentation import collect, merge_snapshot, span, start_profile, write_report
+from win_probability import BIN_WIDTH
+
+CHAR_COLORS = {'peach': 'pink', 'olimar': 'bisque', 'joker': 'maroon', 'inkling': 'darkorange',
+               'zero_suit_samus': 'deepskyblue', 'palutena': 'limegreen', 'fox': 'goldenrod', 'pikachu': 'yellow',
+               'pokemon_trainer': 'tomato', 'mr_game_and_watch': 'black', 'wolf': 'mediumslateblue',
+               'pac_man': 'yellow',
+               'wario': 'gold', 'mario': 'red', 'lucina': 'royalblue', 'pichu': 'yellow', 'snake': 'slategray',
+               'rob': 'firebrick', 'rosalina_and_luma': 'turquoise', 'ike': 'mediumblue', 'mega_man': 'dodgerblue'}
+
+
+def char_color(char):
+    return CHAR_COLORS.get(char, 'gray') if char else 'gray'
+
+
+def histogram(values, xlim, xlabel, color):
+    fig, ax = plt.subplots()
+    ax.set_xlim(0, xlim)
+    ax.set_xlabel(xlabel)
+    ax.hist(values, bins=20, color=color)
+    return fig
+
+
+# Past this many points a scatter is drawn as a hexbin density plot, whose cost doesn't grow with the point count
+DENSITY_THRESHOLD = 50000
+
+
+# Drawn as one collection with a color per point. Points above the diagonal are damage inversions.
+def damage_scatter(data):
+    winning_damage = np.asarray(data['winning_damage'])
+    losing_damage = np.asarray(data['losing_damage'])
+    fig, ax = plt.subplots()
+    ax.set_xlim(0, 600)
+    ax.set_ylim(0, 600)
+    if len(winning_damage) > DENSITY_THRESHOLD:
+        ax.hexbin(winning_damage, losing_damage, gridsize=60, extent=(0, 600, 0, 600), mincnt=1, bins='log')
+        ax.plot([0, 600], [0, 600], color='purple', linestyle='--')
+    else:
+        colors = np.where(winning_damage >= losing_damage, 'blue', 'purple')
+        ax.scatter(winning_damage, losing_damage, c=colors)
+    ax.set_xlabel('Winning damage taken')
+    ax.set_ylabel('Losing damage taken')
+    return fig
+
+
+def stock_diffs_bar(data):
+    fig, ax = plt.subplots()
+    ax.bar(['1 stock', '2 stock', '3 stock'], data['stock_diffs'][1:])
+    return fig
+
+
+def stock_diff_bar(data):
+    fig, ax = plt.subplots()
+    ax.bar(list(data['stock_diff'].keys()), list(data['stock_diff'].values()))
+    return fig
+
+
+def early_deaths_bar(data):
+    fig, ax = plt.subplots()
+    ax.bar(['0', '1', '2'], data['win_rates'], yerr=data['win_rate_errors'])
+    return fig
+
+
+def character_pies(data):
+    fig, ax = plt.subplots(1, 2, figsize=(10, 5))
+    characters = data['characters']
+    ax[0].pie([data['character_freq'][char] for char in characters], labels=characters,
+              colors=[char_color(char) for char in characters])
+    characters = data['characters_by_reps']
+    ax[1].pie([data['character_reps'][char] for char in characters], labels=characters,
+              colors=[char_color(char) for char in characters])
+    return fig
+
+
+def percent_boxplots(data):
+    fig, ax = plt.subplots(2, 1, figsize=(8, 8))
+    characters = data['characters_by_reps']
+    pcts = [data['char_kill_pcts'], data['char_death_pcts']]
+    titles = ['Kill percentage', 'Death percentage']
+    for i in range(2):
+        ax[i].boxplot(pcts[i])
+        ax[i].set_xticks(range(1, len(characters) + 1))
+        ax[i].set_xticklabels(labels=characters, rotation=45, rotation_mode='anchor', verticalalignment='top',
+                              horizontalalignment='right')
+        ax[i].set_xlabel(titles[i])
+    return fig
+
+
+# One scatter and one errorbar call for all groups, with a color per group, rather than a pair of artists per group.
+# Only the labels need an artist each.
+def plot_with_error(ax, points):
+    if not points:
+        return
+    names, x, y, xerr, yerr, chars = zip(*points)
+    # Bootstrap errors are (below, above) pairs, which errorbar wants as two rows
+    xerr, yerr = np.transpose(xerr), np.transpose(yerr)
+    colors = [char_color(char) for char in chars]
+    ax.scatter(x, y, c=colors)
+    error = ax.errorbar(x, y, xerr, yerr, fmt='none')
+    for lines in error[-1]:
+        lines.set_color(colors)
+        lines.set_linestyle('--')
+    for name, point in zip(names, zip(x, y)):
+        ax.annotate(name, point)
+
+
+def error_scatter(points, xlabel, ylabel):
+    fig, ax = plt.subplots(figsize=(8, 8))
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    plot_with_error(ax, points)
+    return fig
+
+
+# Past a couple dozen characters the cells are too small to label, so the full roster is drawn as colors only
+def matchup_heatmap(values, characters):
+    size = max(8, len(characters) / 3)
+    fig, ax = plt.subplots(figsize=(size, size))
+    ax = sns.heatmap(values, xticklabels=characters, yticklabels=characters, annot=len(characters) <= 25, ax=ax)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    return fig
+
+
+# One heatmap per death number, with the opponent's stocks lost down the side and their damage along the bottom
+def win_probability_heatmaps(data):
+    table = data['win_probability']
+    fig, ax = plt.subplots(len(table), 1, figsize=(10, 4 * len(table)))
+    bins = ['%d+' % (BIN_WIDTH * i) for i in range(table.shape[2])]
+    for i in range(len(table)):
+        sns.heatmap(table[i], xticklabels=bins, yticklabels=range(table.shape[1]), annot=True, fmt='.2f', vmin=0,
+                    vmax=1, ax=ax[i])
+        ax[i].set_title('After losing stock %d' % (i + 1))
+        ax[i].set_xlabel('Opponent damage')
+        ax[i].set_ylabel('Opponent stocks lost')
+    fig.tight_layout()
+    return fig
+
+
+# One line per group of a trends.trend_table, with its 95% margin shaded. Windows where a group has no values are gaps.
+# Only every so many windows is labeled once there are too many to read.
+def trend_chart(table, grouping):
+    windows = [window['label'] for window in table['windows']]
+    fig, ax = plt.subplots(figsize=(max(8, len(windows) / 4), 6))
+    x = np.arange(len(windows))
+    for j, group in enumerate(table['groups']):
+        mean, ci = table['mean'][:, j], table['ci'][:, j]
+        color = char_color(group) if grouping == 'character' else None
+        line, = ax.plot(x, mean, label=group, color=color, marker='o' if len(windows) <= 30 else None)
+        ax.fill_between(x, mean - ci, mean + ci, color=line.get_color(), alpha=0.15)
+    step = max(1, len(windows) // 40)
+    ax.set_xticks(x[::step])
+    ax.set_xticklabels(windows[::step], rotation=45, rotation_mode='anchor', horizontalalignment='right')
+    ax.set_ylabel(table['metric'])
+    ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+    return fig
+
+
+ERROR_LABELS = {'kill_pcts': ('Average kill percent', 'Average death percent'),
+                'kills': ('Average stocks taken', 'Average stocks lost'),
+                'damage_dealt': ('Average damage dealt', 'Average damage taken')}
+ERROR_KINDS = {'character': 'character', 'player': 'player', 'hybrid': 'player-character combination'}
+
+
+def error_figure(x_metric, kind):
+    xlabel, ylabel = ERROR_LABELS[x_metric]
+    return (x_metric + '_' + kind, '%s vs. %s by %s' % (xlabel, ylabel.lower(), ERROR_KINDS[kind]),
+            lambda data: error_scatter(data['error_points'][x_metric, kind], xlabel + ' by ' + ERROR_KINDS[kind],
+                                       ylabel + ' by ' + ERROR_KINDS[kind]),
+            ['error_points'])
+
+
+# (name, title, draw function, keys of the analysis dict the function reads), in the order api_test.py shows them
+FIGURES = [
+    ('winning_damage', 'Damage dealt by match winner',
+     lambda data: histogram(data['winning_damage'], 600, 'Damage dealt by match winner', 'green'), ['winning_damage']),
+    ('losing_damage', 'Damage dealt by match loser',
+     lambda data: histogram(data['losing_damage'], 600, 'Damage dealt by match loser', 'red'), ['losing_damage']),
+    ('damage_scatter', 'Winning vs. losing damage taken', damage_scatter, ['winning_damage', 'losing_damage']),
+    ('stock_diffs', 'Matches by stock difference', stock_diffs_bar, ['stock_diffs']),
+    ('winning_death_pcts', 'Death percentage (winning player)',
+     lambda data: histogram(data['winning_death_pcts'], 300, 'Death percentage (winning player)', 'green'),
+     ['winning_death_pcts']),
+    ('losing_death_pcts', 'Death percentage (losing player)',
+     lambda data: histogram(data['losing_death_pcts'], 300, 'Death percentage (losing player)', 'red'),
+     ['losing_death_pcts']),
+    ('stock_deficit', 'Outcome of matches with a 2-stock deficit', stock_diff_bar, ['stock_diff']),
+    ('early_deaths', 'Win rate given number of early deaths (at or below 100%)', early_deaths_bar,
+     ['win_rates', 'win_rate_errors']),
+    ('character_pies', 'Distribution of characters by raw representation (left) and number of representative players '
+     '(right)', character_pies, ['characters', 'characters_by_reps', 'character_freq', 'character_reps']),
+    ('percent_boxplots', 'Distribution of kill percentages (top) and death percentages (bottom) by character',
+     percent_boxplots, ['characters_by_reps', 'char_kill_pcts', 'char_death_pcts']),
+    error_figure('kill_pcts', 'character'),
+    ('matchup_table', 'Character matchup table',
+     lambda data: matchup_heatmap(data['mu_arr'], data['characters_by_freq']), ['mu_arr', 'characters_by_freq']),
+    ('matchup_count', 'Character matchup count',
+     lambda data: matchup_heatmap(data['mu_count'], data['characters_by_freq']), ['mu_count', 'characters_by_freq']),
+    ('matchup_table_roster', 'Character matchup table, full roster',
+     lambda data: matchup_heatmap(data['roster_mu_arr'], data['roster']), ['roster_mu_arr', 'roster']),
+    error_figure('kill_pcts', 'player'),
+    error_figure('kill_pcts', 'hybrid'),
+    error_figure('kills', 'character'),
+    error_figure('kills', 'player'),
+    error_figure('kills', 'hybrid'),
+    error_figure('damage_dealt', 'character'),
+    error_figure('damage_dealt', 'player'),
+    error_figure('damage_dealt', 'hybrid'),
+    ('win_probability', 'Win probability after losing a stock, by opponent state', win_probability_heatmaps,
+     ['win_probability']),
+]
+FIGURE_INDEX = {figure[0]: figure for figure in FIGURES}
+
+
+def draw_figure(name, data):
+    with span('figure.' + name):
+        return FIGURE_INDEX[name][2](data)
+
+
+# Runs in a worker process. Only the parts of the analysis a figure reads are sent to it.
+def render_figure(name, data, out_dir, formats):
+    plt.switch_backend('Agg')
+    start = time.perf_counter()
+    fig = draw_figure(name, data)
+    files = []
+    with span('figure.' + name + '.save'):
+        for extension in formats:
+            files.append(name + '.' + extension)
+            fig.savefig(os.path.join(out_dir, files[-1]), bbox_inches='tight')
+    plt.close(fig)
+    return files, time.perf_counter() - start
+
+
+def error_text(error):
+    if np.ndim(error):
+        return '-%.4f/+%.4f' % tuple(error)
+    return '+- %.4f' % error
+
+
+def summary_lines(data):
+    return [
+        'Damage dealt by match winner: mean %.2f, standard deviation %.2f' % (data['winning_damage'].mean(),
+                                                                            data['winning_damage'].std()),
+        'Damage dealt by match loser: mean %.2f, standard deviation %.2f' % (data['losing_damage'].mean(),
+                                                                           data['losing_damage'].std()),
+        'Proportion of damage inversions (winner took more damage): %.4f %s' % (data['dmg_inversion'][0],
+                                                                               error_text(data['dmg_inversion'][1])),
+        'Proportion of games where the taker of the first stock wins the match: %.4f %s' %
+        (data['first_stock_wins'][0], error_text(data['first_stock_wins'][1])),
+        'Proportion of 2-stock deficits that ended in a comeback: %.4f' %
+        (data['stock_diff']['1-0'] / max(1, sum(data['stock_diff'].values()))),
+    ]
+
+
+def write_index(out_dir, rendered, data):
+    summary = summary_lines(data)
+    with open(os.path.join(out_dir, 'index.md'), 'w') as file:
+        file.write('# Metascouter analysis report\n\n')
+        file.writelines('- %s\n' % line for line in summary)
+        for name, title, files in rendered:
+            file.write('\n## %s\n\n![%s](%s)\n' % (title, name, files[0]))
+    with open(os.path.join(out_dir, 'index.html'), 'w') as file:
+        file.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Metascouter analysis report</title>'
+                   '</head><body>\n<h1>Metascouter analysis report</h1>\n<ul>\n')
+        file.writelines('<li>%s</li>\n' % html.escape(line) for line in summary)
+        file.write('</ul>\n')
+        for name, title, files in rendered:
+            file.write('<h2>%s</h2>\n<img src="%s" alt="%s">\n' % (html.escape(title), files[0], name))
+        file.write('</body></html>\n')
+
+
+# Renders every figure to out_dir and writes the index. Returns the seconds each figure took to render.
+def render_report(data, out_dir, formats=('png',), workers=None):
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(name, title, executor.submit(collect, render_figure, name, {key: data[key] for key in keys},
+                                                 out_dir, formats))
+                   for name, title, _, keys in FIGURES]
+        rendered = []
+        timings = {}
+        for name, title, future in futures:
+            (files, seconds), numbers = future.result()
+            merge_snapshot(numbers)
+            rendered.append((name, title, files))
+            timings[name] = seconds
+    write_index(out_dir, rendered, data)
+    return timings
+
+
+def main():
+    from analysis import analyze
+    from ingest import load_matchups, load_synced_columns, run_metrics_sharded
+
+    parser = argparse.ArgumentParser(description='Render every chart in the analysis to files.')
+    parser.add_argument('out_dir', nargs='?', default='report')
+    parser.add_argument('--formats', default='png', help='comma separated, e.g. png,svg')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes for the metrics, analysis and rendering (default: one per core)')
+    parser.add_argument('--bootstrap', type=int, default=None, metavar='RESAMPLES',
+                        help='use bootstrap confidence intervals over this many resamples of the matches')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the bootstrap resamples')
+    parser.add_argument('--run-report', metavar='PATH', help='write the timings and counters of this run as JSON')
+    parser.add_argument('--profile', action='store_true',
+                        help='also profile the run with cProfile (needs --run-report)')
+    args = parser.parse_args()
+    plt.switch_backend('Agg')
+    if args.profile and not args.run_report:
+        parser.error('--profile needs --run-report')
+    if args.profile:
+        start_profile()
+
+    start = time.perf_counter()
+    store = load_synced_columns()
+    results = run_metrics_sharded(processes=args.workers)
+    data = analyze(store, results, bootstrap=args.bootstrap, seed=args.seed, workers=args.workers,
+                   matchups=load_matchups())
+    analysis_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    timings = render_report(data, args.out_dir, args.formats.split(','), args.workers)
+    render_time = time.perf_counter() - start
+    slowest = max(timings, key=timings.get)
+    print('Analysis: %.2f s' % analysis_time)
+    print('Rendered %d figures in %.2f s (slowest: %s, %.2f s)' % (len(timings), render_time, slowest,
+                                                                   timings[slowest]))
+    print('Report written to', os.path.join(args.out_dir, 'index.html'))
+    if args.run_report:
+        write_report(args.run_report)
+        print('Run report written to', args.run_report)
+
+
+if __name__ == '__main__':
+    main()
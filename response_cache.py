@@ -0,0 +1,135 @@
+# A persistent cache for Metascouter API responses. Each endpoint (path plus query) is stored as one JSON file holding
+# the decoded body and the validators the server sent with it. Entries are served without a request until their TTL
+# runs out, after which they are revalidated with If-None-Match/If-Modified-Since. The cache is capped in size and
+# evicts the least recently used entries first. The order entries were last used in is kept in memory, and on disk as
+# file modification times so that it carries over to the next run.
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from fast_json import dumps, loads
+
+# Completed tournaments and their sets don't change, so they can be kept for a long time. The tournament list is the
+# only place new events show up, so it gets revalidated much more often.
+CACHE_TTLS = [
+    (re.compile(r'^tournaments/?(\?|$)'), 60 * 60),
+    (re.compile(r'^tournaments/\d+'), 7 * 24 * 60 * 60),
+    (re.compile(r'^sets/\d+/matches'), 30 * 24 * 60 * 60),
+]
+DEFAULT_TTL = 60 * 60
+MAX_BYTES = 512 * 1024 * 1024
+# Once over the cap, entries are evicted until the cache is down to this share of it, so that it isn't over again on
+# the very next write
+LOW_WATER = 0.9
+
+
+# Query parameters are sorted so that 'tournaments?offset=0&limit=80' and 'tournaments?limit=80&offset=0' share an entry
+def cache_key(url):
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return parts.path.strip('/') + ('?' + query if query else '')
+
+
+class ResponseCache:
+    def __init__(self, directory, max_bytes=MAX_BYTES, ttls=CACHE_TTLS, default_ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        # File name -> size, least recently used first
+        self.sizes = OrderedDict()
+        entries = []
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if name.endswith('.json'):
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.sizes[name] = size
+        self.total_bytes = sum(self.sizes.values())
+
+    def ttl(self, url):
+        key = cache_key(url)
+        for pattern, seconds in self.ttls:
+            if pattern.search(key):
+                return seconds
+        return self.default_ttl
+
+    def filename(self, url):
+        return hashlib.sha1(cache_key(url).encode()).hexdigest() + '.json'
+
+    # Returns the stored entry (a dict with 'body', 'etag', 'last_modified' and 'fetched_at') or None. Reading an entry
+    # makes it the most recently used.
+    def get(self, url):
+        name = self.filename(url)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as file:
+                entry = loads(file.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            if name in self.sizes:
+                self.sizes.move_to_end(name)
+        return entry
+
+    def is_fresh(self, url, entry):
+        return time.time() - entry['fetched_at'] < self.ttl(url)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        entry = {'url': cache_key(url), 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time(),
+                 'body': body}
+        self.write(url, entry)
+        return entry
+
+    # A 304 means the stored body is still current, so only the fetch time moves forward
+    def refresh(self, url, entry):
+        entry['fetched_at'] = time.time()
+        self.write(url, entry)
+        return entry
+
+    def write(self, url, entry):
+        name = self.filename(url)
+        path = os.path.join(self.directory, name)
+        payload = dumps(entry)
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temp_path, 'wb') as file:
+            file.write(payload)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.total_bytes += len(payload) - self.sizes.get(name, 0)
+            self.sizes[name] = len(payload)
+            self.sizes.move_to_end(name)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    # Removes the least recently used entries down to the low-water mark, always keeping the one just written (the most
+    # recently used). Called with the lock held.
+    def evict(self):
+        while len(self.sizes) > 1 and self.total_bytes > self.max_bytes * LOW_WATER:
+            name, size = self.sizes.popitem(last=False)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for name in list(self.sizes):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            self.sizes = OrderedDict()
+            self.total_bytes = 0
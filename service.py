@@ -0,0 +1,297 @@
+# A long-running service that keeps the synced matches, the metric results and the matchup matrix in memory and serves
+# stats over a local HTTP/JSON API, so a dashboard can read current numbers in milliseconds instead of rerunning the
+# analysis.
+#
+#     python service.py [--port 8050] [--poll 600] [--tournament Genesis --tournament EVO ...]
+#
+# Endpoints (all GET, apart from POST /sync):
+#
+#     /status                           how many matches, sets and tournaments are loaded, and when they last changed
+#     /stats/<grouping>                 mean, standard deviation, 95% margin and count of every metric in aggregate.py,
+#                                       by character, player, hybrid (player-character) or outcome; groups seen in
+#                                       fewer than ?min_matches=30 matches are left out
+#     /matchups                         every character, most played first, with wins[i][j] and counts[i][j]
+#     /stocks                           final stock counts, 2-stock deficits and comebacks, and outcomes by early deaths
+#     /metrics/<name>                   any metric from metrics.py as it stands
+#     /query?player=Cyan&by=opponent    query.py's filtered summaries, with the same filters and breakdowns
+#     POST /sync                        syncs now, either the tournaments in the JSON body ({"tournaments": [...]} with
+#                                       entries like the API's tournament list) or the tournament list from the API
+#
+# With --poll, the tournament list is fetched and synced every so many seconds. A sync only fetches new sets (see
+# ingest.sync) and appends their matches to the columnar store, and only the new matches are run through the metrics,
+# whose results are merged into the ones in memory (see metrics.merge_results). The matchup matrix is the one sync keeps
+# up to date. Responses are cached until the data changes and carry an ETag, so a dashboard polling an endpoint that
+# hasn't changed gets a 304.
+
+import argparse
+import copy
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from aggregate import group_table, GROUPINGS
+from analysis import proportion_with_margin, MIN_MATCHES
+from fast_json import dumps, loads
+from ingest import (build_columns, list_tournaments, load_columns, load_matchups, load_state, load_tournaments,
+                    metrics_shard, run_metrics_sharded, store_is_current, sync, DATA_DIR, MATCHES_FILE,
+                    MATCHES_FLAT_FILE)
+from instrumentation import count, span
+from metascouter_api import set_credentials, MAX_WORKERS
+from metrics import merge_results
+from query import load_index, query, resolve_tournaments, tournament_labels, BREAKDOWNS
+
+# Cached responses kept per version of the data, beyond which the cache starts over
+MAX_CACHED = 1024
+
+
+# Plain lists, dicts and numbers for JSON, with NaN (a group with no values) as null
+def jsonable(value):
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(jsonable(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return jsonable(value.tolist())
+    if isinstance(value, np.generic):
+        return jsonable(value.item())
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def status_view(data, params):
+    state = data['state']
+    return {'matches': len(data['store']), 'sets': len(state['sets']), 'tournaments': len(state['tournaments']),
+            'version': data['version'], 'updated': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(data['updated']))}
+
+
+def stats_view(data, params, grouping):
+    if grouping not in GROUPINGS:
+        return None
+    return group_table(data['store'], grouping, int(params.get('min_matches', [MIN_MATCHES])[0]))
+
+
+def matchups_view(data, params):
+    matchups = data['matchups']
+    characters = matchups.characters()
+    wins, counts = matchups.table(characters)
+    return {'characters': characters, 'wins': wins, 'counts': counts}
+
+
+def stocks_view(data, params):
+    results = data['results']
+    deficits = results['stock_diff']
+    first_stock_wins = results['first_stock_wins']
+    return {'final_stocks': results['stock_diffs'], 'two_stock_deficits': deficits,
+            'comeback_rate': deficits['1-0'] / sum(deficits.values()) if sum(deficits.values()) else None,
+            'outcomes_by_early_deaths': results['outcomes'],
+            'first_stock_wins': proportion_with_margin(first_stock_wins) if first_stock_wins else None}
+
+
+def metric_view(data, params, name):
+    return data['results'].get(name)
+
+
+def query_view(data, params):
+    by = params.get('by', [None])[0]
+    if by is not None and by not in BREAKDOWNS:
+        raise ValueError('by must be one of ' + ', '.join(BREAKDOWNS))
+    tournaments = data['tournaments']
+    filters = {key: params[key][0] for key in ('player', 'character', 'opponent', 'opponent_character')
+               if key in params}
+    if 'tournament' in params:
+        filters['tournaments'] = resolve_tournaments(tournaments, params['tournament'])
+    if 'set' in params:
+        filters['sets'] = [int(set_id) for set_id in params['set']]
+    return query(data['store'], data['index'], by, tournament_labels(tournaments), **filters)
+
+
+# Path (without the leading slash) -> view. Views take the loaded data, the query parameters and whatever follows the
+# path, and return what to send back, or None for a 404.
+ROUTES = {'status': status_view, 'stats': stats_view, 'matchups': matchups_view, 'stocks': stocks_view,
+          'metrics': metric_view, 'query': query_view}
+
+
+class StatsService:
+    def __init__(self, data_dir=DATA_DIR, tournament_names=None, workers=MAX_WORKERS, processes=None):
+        self.data_dir = data_dir
+        self.tournament_names = set(tournament_names) if tournament_names else None
+        self.workers = workers
+        self.processes = processes
+        self.sync_lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+        self.responses = {}
+        self.version = 0
+        state = load_state(data_dir)
+        if not store_is_current(data_dir, state):
+            build_columns(data_dir, state, processes)
+        self.data = self.loaded(state, run_metrics_sharded(data_dir, processes, state=state))
+
+    # Everything the views read, as one dict that's swapped out whole when the data changes, so a request never sees
+    # half of an update. The store and index files are all opened here rather than on first use: a sync replaces them
+    # before the new dict is swapped in, and requests still on the old one have to keep reading the old files.
+    def loaded(self, state, results):
+        store = load_columns(self.data_dir).open_all()
+        self.version += 1
+        return {'state': state, 'store': store, 'index': load_index(store).open_all(), 'results': results,
+                'matchups': load_matchups(self.data_dir, state), 'tournaments': load_tournaments(self.data_dir),
+                'version': self.version, 'updated': time.time()}
+
+    # Syncs the given tournaments, or the tournament list from the API, and folds whatever new matches came in into the
+    # data in memory. Returns whether anything changed.
+    def update(self, tournaments=None):
+        with self.sync_lock, span('service.update'):
+            if tournaments is None:
+                tournaments = list_tournaments(self.tournament_names)
+            before = self.data['state']['offsets']
+            sync(tournaments, self.data_dir, self.workers, processes=self.processes)
+            state = load_state(self.data_dir)
+            after = state['offsets']
+            if after == before:
+                return False
+            # Merging adds to the first results in place, and requests may still be reading them
+            shard = {name: (before[name], after[name]) for name in (MATCHES_FILE, MATCHES_FLAT_FILE)}
+            # The new store rows are only the new matches if the store in memory covered exactly the old ones
+            store = load_columns(self.data_dir)
+            if store.offset == after[MATCHES_FILE] and self.data['store'].offset == before[MATCHES_FILE]:
+                shard['rows'] = (len(self.data['store']), len(store))
+            results = merge_results([copy.deepcopy(self.data['results']), metrics_shard(self.data_dir, shard, None)])
+            data = self.loaded(state, results)
+            with self.cache_lock:
+                self.data = data
+                self.responses = {}
+            return True
+
+    # (status, JSON body) for a GET of path, cached until the data changes
+    def get(self, path):
+        data = self.data
+        with self.cache_lock:
+            cached = self.responses.get(path) if data is self.data else None
+        if cached:
+            count('service.cache_hits')
+            return cached
+        parts = urlsplit(path)
+        route, _, rest = parts.path.strip('/').partition('/')
+        view = ROUTES.get(route)
+        try:
+            with span('service.' + (route if view else 'not_found')):
+                body = view(data, parse_qs(parts.query), *([rest] if rest else [])) if view else None
+        except (ValueError, TypeError) as error:
+            return 400, dumps({'detail': str(error)})
+        except Exception as error:
+            count('service.errors')
+            print('Error serving', path + ':', repr(error))
+            return 500, dumps({'detail': 'Internal server error.'})
+        if body is None:
+            return 404, dumps({'detail': 'Not found.'})
+        response = 200, dumps(jsonable(body))
+        with self.cache_lock:
+            if data is self.data:
+                if len(self.responses) >= MAX_CACHED:
+                    self.responses = {}
+                self.responses[path] = response
+        return response
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body go out as separate writes, which Nagle's algorithm would hold up on a kept-alive
+    # connection until the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        etag = '"%d"' % service.data['version']
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        status, body = service.get(self.path)
+        self.send_body(status, body, {'ETag': etag} if status == 200 else None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = self.rfile.read(length)
+        if urlsplit(self.path).path.strip('/') != 'sync':
+            self.send_body(404, dumps({'detail': 'Not found.'}))
+            return
+        try:
+            tournaments = loads(payload)['tournaments'] if payload.strip() else None
+        except (ValueError, TypeError, KeyError):
+            self.send_body(400, dumps({'detail': 'Expected {"tournaments": [...]}'}))
+            return
+        service = self.server.service
+        try:
+            changed = service.update(tournaments)
+        except (Exception, SystemExit) as error:
+            self.send_body(502, dumps({'detail': 'Sync failed: %s' % error}))
+            return
+        self.send_body(200, dumps({'changed': changed, 'matches': len(service.data['store']),
+                                   'version': service.data['version']}))
+
+
+def start_service(service, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def poll(service, interval):
+    while True:
+        try:
+            service.update()
+        except (Exception, SystemExit) as error:
+            print('Sync failed:', error)
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve stats over the synced matches as JSON and keep them up to '
+                                                 'date.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--poll', type=float, default=0, metavar='SECONDS',
+                        help='sync the tournament list from the API this often (default: only on POST /sync)')
+    parser.add_argument('--tournament', action='append', help='only sync tournaments with this name (repeatable)')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='API requests in flight at once')
+    parser.add_argument('--processes', type=int, default=None, help='processes for the first metric pass')
+    args = parser.parse_args()
+
+    # The API needs a JWT token, which is retrieved the first time a request can't be served from the response cache
+    set_credentials(os.getenv('METASCOUTER_USER', 'Cyan'), os.getenv('METASCOUTER_PWD'))
+    service = StatsService(tournament_names=args.tournament, workers=args.workers, processes=args.processes)
+    server = start_service(service, args.host, args.port)
+    print('Serving %d matches on http://%s:%d/' % (len(service.data['store']), args.host, server.server_address[1]))
+    if args.poll:
+        threading.Thread(target=poll, args=(service, args.poll), daemon=True).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
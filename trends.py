@@ -0,0 +1,202 @@
+# How metrics move over the season, instead of pooled over every synced tournament. Tournaments are put in date order
+# and grouped into windows: each tournament on its own, a rolling window of the last N tournaments, or calendar months,
+# quarters or years. For each window the metric's mean, 95% margin and count are given per group (character, player,
+# player-character combination, or character matchup for win rates) as a windows x groups table.
+#
+# Windows are never recomputed from the matches. Every player row is keyed by (tournament, group) in one np.bincount
+# pass that gives each tournament's count, sum and sum of squares per group, and those are accumulated over the
+# tournaments in order. A window's sums are then the running sums where it ends minus the running sums where it starts,
+# which is how a rolling window slides: the tournament coming in is added and the one dropping out is taken away. The
+# cost is one pass over the rows plus one subtraction per window, however many years of tournaments there are.
+#
+#     python trends.py kill_pcts [--by character] [--window rolling --size 4] [--top 8] [--json] [--chart kill.png]
+
+import argparse
+import json
+
+import numpy as np
+
+from aggregate import group_keys, group_names, metric_values, METRICS
+
+WINDOWS = ['tournament', 'rolling', 'month', 'quarter', 'year']
+TREND_METRICS = METRICS + ['win_rate']
+TREND_GROUPINGS = ['character', 'player', 'hybrid', 'matchup']
+ROLLING_SIZE = 4
+TOP_GROUPS = 8
+
+
+# A tournament's date as YYYY-MM-DD, from the tournament list entry, or None if it has none
+def tournament_date(tournament):
+    date = (tournament.get('start_date') or tournament.get('date')) if tournament else None
+    return date[:10] if date else None
+
+
+# The tournaments that have matches in the store, in date order (undated ones last, by ID), and the index in that order
+# of every match's tournament
+def tournament_order(store, tournaments):
+    tids, match_tournaments = np.unique(np.asarray(store['matches']['tournament']), return_inverse=True)
+    dates = [tournament_date(tournaments.get(int(tid))) for tid in tids]
+    order = sorted(range(len(tids)), key=lambda i: (dates[i] is None, dates[i] or '', tids[i]))
+    position = np.empty(len(tids), dtype=np.int64)
+    position[order] = np.arange(len(tids))
+    return [int(tids[i]) for i in order], [dates[i] for i in order], position[match_tournaments.ravel()]
+
+
+def calendar_period(date, window):
+    if window == 'month':
+        return date[:7]
+    elif window == 'quarter':
+        return '%s-Q%d' % (date[:4], (int(date[5:7]) - 1) // 3 + 1)
+    return date[:4]
+
+
+# (label, first, last) for each window, where the window covers the tournaments first to last - 1 in date order.
+# Rolling windows start once size tournaments are in, and calendar windows leave out undated tournaments.
+def window_spans(labels, dates, window, size=ROLLING_SIZE):
+    if window == 'tournament':
+        return [(label, i, i + 1) for i, label in enumerate(labels)]
+    elif window == 'rolling':
+        return [(labels[i], max(0, i + 1 - size), i + 1) for i in range(min(size, len(labels)) - 1, len(labels))]
+    spans = []
+    for i, date in enumerate(dates):
+        if date is None:
+            break
+        period = calendar_period(date, window)
+        if spans and spans[-1][0] == period:
+            spans[-1] = (period, spans[-1][1], i + 1)
+        else:
+            spans.append((period, i, i + 1))
+    return spans
+
+
+# Player row keys and labels for the character matchup (the player's character against the opponent's)
+def matchup_keys(store):
+    characters = np.asarray(store['players']['character'], dtype=np.int64)
+    opponents = characters.reshape(-1, 2)[:, ::-1].ravel()
+    num_characters = len(store.character_names)
+    return characters * num_characters + opponents, num_characters * num_characters, \
+        [char + ' vs ' + opponent for char in store.character_names for opponent in store.character_names]
+
+
+# (rows, values, keys of every player row, number of keys, key labels) for a metric over a grouping
+def trend_values(store, metric, grouping):
+    if metric == 'win_rate':
+        won = np.asarray(store['players']['won'], dtype=np.float64)
+        rows, values = np.arange(len(won)), won
+    else:
+        rows, values = metric_values(store, metric)
+    if grouping == 'matchup':
+        keys, num_groups, names = matchup_keys(store)
+    else:
+        keys, num_groups = group_keys(store, grouping)
+        names = group_names(store, grouping)
+    return rows, values, np.asarray(keys, dtype=np.int64), num_groups, names
+
+
+# Count, sum and sum of squares of values per (tournament, group), accumulated over the tournaments: row t is the totals
+# over tournaments 0 to t - 1, so row 0 is zeros
+def running_sums(events, keys, values, num_events, num_groups):
+    composite = events * num_groups + keys
+    size = num_events * num_groups
+    sums = np.zeros((3, num_events + 1, num_groups))
+    for i, weights in enumerate([None, values, values * values]):
+        sums[i, 1:] = np.bincount(composite, weights=weights, minlength=size).reshape(num_events, num_groups)
+    return np.cumsum(sums, axis=1)
+
+
+# Mean, standard deviation and 95% margin per window and group, from the running sums at each window's ends. Groups
+# with no values in a window come out as NaN, as in aggregate.group_stats.
+def window_stats(sums, spans):
+    starts = [first for _, first, _ in spans]
+    ends = [last for _, _, last in spans]
+    count, total, squares = sums[:, ends] - sums[:, starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        # Sums of squares lose precision against a large mean, so tiny negative variances are rounded up to 0
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0))
+        ci = 1.96 * std / np.sqrt(count)
+    return {'count': np.rint(count).astype(np.int64), 'mean': mean, 'std': std, 'ci': ci}
+
+
+# The trend table of a metric: {'windows': [{'label', 'first', 'last', 'start_date', 'end_date'}], 'groups': [labels],
+# 'count', 'mean', 'std', 'ci'}, with a windows x groups array for each statistic. Only the top groups by count over
+# every window are kept, and only those with at least min_count values, so the running sums stay small however many
+# players there are.
+def trend_table(store, tournaments, metric, grouping='character', window='rolling', size=ROLLING_SIZE, top=TOP_GROUPS,
+                min_count=1):
+    tids, dates, match_events = tournament_order(store, tournaments)
+    labels = [tournaments[tid]['name'] + ' ' + str(tournaments[tid]['number']) if tid in tournaments else str(tid)
+              for tid in tids]
+    rows, values, keys, num_groups, names = trend_values(store, metric, grouping)
+    keys = keys[rows]
+    totals = np.bincount(keys, minlength=num_groups)
+    if grouping == 'matchup':
+        # A mirror match is always won by one side and lost by the other, so it has no trend to show
+        totals[np.arange(len(store.character_names)) * (len(store.character_names) + 1)] = 0
+    groups = [group for group in np.argsort(-totals, kind='stable')[:top] if totals[group] >= max(1, min_count)]
+    selected = np.full(num_groups, -1, dtype=np.int64)
+    selected[groups] = np.arange(len(groups))
+    keys = selected[keys]
+    kept = keys >= 0
+    sums = running_sums(match_events[rows[kept] // 2], keys[kept], values[kept], len(tids), len(groups))
+    spans = window_spans(labels, dates, window, size)
+    stats = window_stats(sums, spans)
+    stats['windows'] = [{'label': label, 'first': labels[first], 'last': labels[last - 1],
+                         'start_date': dates[first], 'end_date': dates[last - 1]} for label, first, last in spans]
+    stats['groups'] = [names[group] for group in groups]
+    stats['metric'] = metric
+    return stats
+
+
+# A windows x groups array as nested lists, with NaN (no values in the window) as None
+def json_rows(values):
+    values = values.astype(object)
+    values[np.isnan(values.astype(np.float64))] = None
+    return values.tolist()
+
+
+def format_table(table):
+    lines = ['%-24s' % 'window' + ''.join('%22s' % group[:21] for group in table['groups'])]
+    for i, window in enumerate(table['windows']):
+        cells = ['-' if table['count'][i, j] == 0 else
+                 '%.2f +- %.2f (%d)' % (table['mean'][i, j], table['ci'][i, j], table['count'][i, j])
+                 for j in range(len(table['groups']))]
+        lines.append('%-24s' % window['label'][:23] + ''.join('%22s' % cell for cell in cells))
+    return '\n'.join(lines)
+
+
+def main():
+    from ingest import load_synced_columns, load_tournaments
+
+    parser = argparse.ArgumentParser(description='How a metric moves across tournaments, by window.')
+    parser.add_argument('metric', choices=TREND_METRICS)
+    parser.add_argument('--by', choices=TREND_GROUPINGS, default='character',
+                        help='group by this (default: %(default)s, matchup only makes sense for win_rate)')
+    parser.add_argument('--window', choices=WINDOWS, default='rolling', help='(default: %(default)s)')
+    parser.add_argument('--size', type=int, default=ROLLING_SIZE,
+                        help='tournaments in a rolling window (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=TOP_GROUPS,
+                        help='only the groups with the most values over every window (default: %(default)s)')
+    parser.add_argument('--min-count', type=int, default=1, help='leave out groups with fewer values than this')
+    parser.add_argument('--json', action='store_true', help='print the table as JSON')
+    parser.add_argument('--chart', metavar='PATH', help='also draw the trend chart to this file, e.g. trends.png')
+    args = parser.parse_args()
+    if args.size < 1:
+        parser.error('--size must be at least 1')
+
+    table = trend_table(load_synced_columns(), load_tournaments(), args.metric, args.by, args.window, args.size,
+                        args.top, args.min_count)
+    if args.json:
+        print(json.dumps({key: json_rows(value) if isinstance(value, np.ndarray) else value
+                          for key, value in table.items()}, indent=2))
+    else:
+        print(format_table(table))
+    if args.chart:
+        from report import trend_chart
+
+        trend_chart(table, args.by).savefig(args.chart, bbox_inches='tight')
+        print('Chart written to', args.chart)
+
+
+if __name__ == '__main__':
+    main()
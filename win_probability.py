@@ -0,0 +1,101 @@
+# Win probability from the state of a match at the moment a player loses a stock. Each of a player's first two deaths
+# is one observation: which death it was, how many stocks the opponent had lost by then, and the opponent's damage at
+# that moment in 20% bins (everything past 200% shares the last bin). Whether the player who died went on to win is
+# averaged over every observation in the same state, giving table[death - 1][opponent stocks lost][damage bin].
+#
+# The opponent's state is found by lining up the two players' timelines from the columnar store's deaths and health
+# tables (see match_store.py) with one np.searchsorted over all matches, instead of walking each match's health_data
+# with index pointers.
+
+import numpy as np
+
+from instrumentation import timed
+
+MAX_DEATHS = 2
+MAX_STOCKS_LOST = 3
+BIN_WIDTH = 20
+NUM_BINS = 11
+
+
+# For each query (player row, time), the index of the last health sample of that player row taken before the time,
+# or of its first sample if there is none. The samples of a player row are sorted by time, so shifting each row's times
+# past the end of the previous row's makes the whole column sorted, and every query becomes a single binary search.
+def samples_before(health, rows, times):
+    offsets = np.asarray(health['offsets'])
+    sample_times = np.asarray(health['time'])
+    span = (sample_times.max() if len(sample_times) else 0) + max(times.max() if len(times) else 0, 0) + 1
+    sample_rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    keys = sample_rows * span + sample_times
+    found = np.searchsorted(keys, rows * span + times, side='left') - 1
+    return np.maximum(found, offsets[rows])
+
+
+# The state of the opponent at each of the first MAX_DEATHS deaths of every player, as a dict of arrays with one entry
+# per observation: the player row that died, the time, death number (from 0), opponent stocks lost, opponent damage bin,
+# and whether the player who died won the match. Observations where the opponent has no health data are dropped.
+def death_states(store):
+    deaths = store['deaths']
+    health = store['health']
+    death_offsets = np.asarray(deaths['offsets'])
+    rows = np.repeat(np.arange(len(death_offsets) - 1), np.diff(death_offsets))
+    death_num = np.arange(len(rows)) - death_offsets[rows]
+    keep = death_num < MAX_DEATHS
+    rows, death_num, times = rows[keep], death_num[keep], np.asarray(deaths['time'])[keep]
+
+    health_offsets = np.asarray(health['offsets'])
+    opponents = rows ^ 1
+    has_health = health_offsets[opponents + 1] > health_offsets[opponents]
+    rows, death_num, times, opponents = rows[has_health], death_num[has_health], times[has_health], \
+        opponents[has_health]
+
+    # A damage reading of 0 after a player's first sample means they lost a stock. Counting those up to the sample
+    # found for each death gives how many stocks the opponent had lost by then.
+    damage = np.asarray(health['damage'])
+    resets = damage == 0
+    resets[health_offsets[:-1][health_offsets[:-1] < len(resets)]] = False
+    resets_so_far = np.cumsum(resets)
+    index = samples_before(health, opponents, times)
+    stocks_lost = resets_so_far[index] - resets_so_far[health_offsets[opponents]]
+    dmg_bin = np.minimum(NUM_BINS - 1, damage[index] // BIN_WIDTH).astype(np.int64)
+
+    valid = stocks_lost < MAX_STOCKS_LOST
+    return {'row': rows[valid], 'time': times[valid], 'death_num': death_num[valid],
+            'stocks_lost': stocks_lost[valid], 'dmg_bin': dmg_bin[valid],
+            'won': np.asarray(store['players']['won'])[rows[valid]]}
+
+
+def state_index(states):
+    return (states['death_num'] * MAX_STOCKS_LOST + states['stocks_lost']) * NUM_BINS + states['dmg_bin']
+
+
+# Returns {'wins', 'count', 'prob'}, each shaped (MAX_DEATHS, MAX_STOCKS_LOST, NUM_BINS). prob is NaN for states that
+# never came up.
+@timed('win_probability.table')
+def win_probability_table(store, states=None):
+    states = death_states(store) if states is None else states
+    index = state_index(states)
+    size = MAX_DEATHS * MAX_STOCKS_LOST * NUM_BINS
+    count = np.bincount(index, minlength=size)
+    wins = np.bincount(index, weights=states['won'], minlength=size)
+    with np.errstate(invalid='ignore'):
+        prob = wins / count
+    shape = (MAX_DEATHS, MAX_STOCKS_LOST, NUM_BINS)
+    return {'wins': wins.reshape(shape), 'count': count.reshape(shape), 'prob': prob.reshape(shape)}
+
+
+# Player 1's estimated chance of winning over the course of one match, as (times, probabilities). It starts at 0.5,
+# moves to the table's estimate at each of either player's first two deaths, and ends at 1 or 0 at the last death.
+def match_curve(store, match, table, states=None):
+    states = death_states(store) if states is None else states
+    mine = states['row'] // 2 == match
+    prob = table['prob'].ravel()[state_index(states)[mine]]
+    # The table gives the chance that the player who died wins
+    prob = np.where(states['row'][mine] % 2 == 0, prob, 1 - prob)
+    order = np.argsort(states['time'][mine], kind='stable')
+
+    deaths = store['deaths']
+    offsets = np.asarray(deaths['offsets'])
+    end = np.asarray(deaths['time'])[offsets[2 * match]:offsets[2 * match + 2]].max()
+    player1_won = bool(store['players']['won'][2 * match])
+    times = np.concatenate([[0.0], states['time'][mine][order], [end]])
+    return times, np.concatenate([[0.5], prob[order], [1.0 if player1_won else 0.0]])